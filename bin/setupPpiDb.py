@@ -10,6 +10,8 @@ Create a folder and place there some file with list of PDBs to analyze.
 The program will create the following directory structure in the same directory:
     ./pdbs/ - list of pdbs downloaded
     ./results/ - results of the analysis scripts
+    ./cache/ - parsed structures, so each PDB file is parsed once by all the scripts (only with --cacheSize,
+               or in the directory given by --cacheDir)
 """
 from __future__ import print_function
 import argparse
@@ -24,7 +26,6 @@ import pyPPI.surfaceComplementarity.VDW as VDW
 import pyPPI.surfaceComplementarity.interfaceDepth as Periphery
 from pyPPI.ASA import ASA
 from pyPPI.hbonds import hbonds
-from pyPPI.kdtree import KDTree
 import pyPPI.pdbReader as pdbReader
 from pyPPI.pdbReader import PDBReader
 import pyPPI.electrostat as electrostat
@@ -131,8 +132,8 @@ def calcInterfaceDist(pdb, result):
     if len(partA) == 0 or len(partB) == 0:
         print('WARNING: %s doesnt have atoms in one its chains' % pdb.name)
         return
-    aTree = KDTree.construct_from_data(partA[:])
-    bTree = KDTree.construct_from_data(partB[:])
+    aTree = pdb.getTree(chains=pdb.interfaceParts[0])
+    bTree = pdb.getTree(chains=pdb.interfaceParts[1])
     complexChains = ':'.join(pdb.interfaceParts)
     for part, tree in [(partA, bTree), (partB, aTree)]:
         for atom in part:
@@ -242,11 +243,7 @@ def getInterfaceAtoms(cur, pdb):
     select Chain,ResId,Symbol from NinterfaceAtoms
     where PDB='%s'
     ''' % pdb.name)
-    interfaceAtoms = []
-    for chain, resid, symbol in cur.fetchall():
-        interfaceAtoms.append(
-            next(a for a in pdb.atoms if a.chain == chain and a.resId == resid and a.symbol == symbol))
-    return interfaceAtoms
+    return [pdb.atoms[i] for i in pdb.resolveAtoms(cur.fetchall(), first=True)]
 
 
 def fillInterfacePeriphrial(pdbsToAnalyze):
@@ -377,6 +374,10 @@ if __name__ == "__main__":
     parser.add_argument("pdbList", help="A file with a list of PDB to download")
     parser.add_argument("--folder", help="Name of the folder to contain downloaded files")
     parser.add_argument("--dbName", help="Name of the database to create.")
+    parser.add_argument("--cacheDir", help="Directory of cache of parsed structures (no cache by default)")
+    parser.add_argument("--cacheSize", type=int,
+                        help="Maximal size (MB) of the cache of parsed structures (default %i). Enables the cache "
+                             "(in ./cache/ if no --cacheDir)" % (pdbReader.CACHE_MAX_BYTES // 1024 ** 2))
     args = parser.parse_args()
     if args.pdbList is None:
         sys.exit("Please provide a file with list of PDBs to anaylze")
@@ -387,6 +388,10 @@ if __name__ == "__main__":
     PDBS_DIR = os.path.join(WORKING_DIRECTORY, 'pdbs')
     pdbReader.PDBS_DIR = PDBS_DIR
     RESULTS_DIR = os.path.join(WORKING_DIRECTORY, 'results')
+    if args.cacheDir is not None or args.cacheSize is not None:
+        pdbReader.CACHE_DIR = args.cacheDir if args.cacheDir is not None else os.path.join(WORKING_DIRECTORY, 'cache')
+        if args.cacheSize is not None:
+            pdbReader.CACHE_MAX_BYTES = args.cacheSize * 1024 ** 2
     for dir in [PDBS_DIR, RESULTS_DIR]:
         if not os.path.exists(dir):
             os.mkdir(dir)
@@ -6,6 +6,8 @@ from __future__ import print_function
 import logging
 from math import cos, sin, sqrt, pi
 
+import numpy as np
+
 from .pdbReader import PDBReader
 from .resReduce import mapUnbound
 
@@ -19,7 +21,25 @@ KNOWN_RADIUS = {
     'H': 1.000,
     'X': 1.700  # for undetermined atom assume Carbon
 }
-SPIRAL_POINTS = 20
+SPIRAL_POINTS = 20  # default resolution: number of points sampled on each ball
+# ASA engines:
+ENGINE_SPIRAL = 'spiral'  # per atom and per point (original implementation)
+ENGINE_NUMPY = 'numpy'  # batched occlusion masks for all the atoms of a chain
+ENGINE_BITMASK = 'bitmask'  # occlusion bitmasks from lookup table (approximation)
+ENGINES = [ENGINE_SPIRAL, ENGINE_NUMPY, ENGINE_BITMASK]
+# upper bound for number of (atom, point, neighbor) distances computed at once by batched engines
+BATCH_SIZE = 2 ** 20
+# bitmask engine quantization: neighbor direction (z and azimuth bins) and occlusion cap (cosine bins)
+BITMASK_Z_BINS = 32
+BITMASK_PHI_BINS = 64
+BITMASK_COS_BINS = 128
+# adaptive refinement: resolutions used after the coarse resolution, and default per atom tolerance (A^2)
+ADAPTIVE_RESOLUTIONS = (20, 92, 492)
+ADAPTIVE_TOLERANCE = 1.0
+# cache of points sampled on unit ball, by number of points
+_SPHERE_TEMPLATES = dict()
+# cache of bitmask lookup tables, by number of points
+_BITMASK_TABLES = dict()
 
 
 class ASA(object):
@@ -27,12 +47,26 @@ class ASA(object):
     Accessible surface area calculations
     """
 
-    def __init__(self, pdb, unbound_a=None, unbound_b=None):
+    def __init__(self, pdb, unbound_a=None, unbound_b=None, engine=ENGINE_NUMPY, n_points=SPIRAL_POINTS,
+                 single_pass=True, tolerance=None):
         """
                 Calculates asa for pdb. you can specify pdbA and pdbB as unbound version
                 otherwise it just extract it from the pdb
+                engine is one of ENGINES, n_points is the number of points sampled on each atom
+                single_pass - batched engines compute intra and inter ASA from the same occlusion tests
+                tolerance - per atom tolerance (A^2) for adaptive refinement by batched engines:
+                            atoms are sampled with n_points and occluded atoms are refined
+                            (see ADAPTIVE_RESOLUTIONS). None for fixed resolution
                 """
+        if engine not in ENGINES:
+            raise ValueError('unknown ASA engine %s' % engine)
+        if engine == ENGINE_SPIRAL and tolerance is not None:
+            raise ValueError('adaptive refinement is supported only by batched engines')
         self.pdb = pdb
+        self.engine = engine
+        self.n_points = n_points
+        self.single_pass = single_pass
+        self.tolerance = tolerance
         if unbound_a is not None:
             self.pdbA = unbound_a[0]
             self.pdbB = unbound_b[0]
@@ -80,17 +114,30 @@ class ASA(object):
         self.perAtom.close()
 
     @staticmethod
-    def calc_unbound_protein(pdb):
+    def calc_unbound_protein(pdb, engine=ENGINE_NUMPY, n_points=SPIRAL_POINTS, tolerance=None):
         """Calculates ASA for unbound protein
         :param pdb: protein
+        :param engine: ASA engine to use (one of ENGINES)
+        :param n_points: number of points sampled on each atom
+        :param tolerance: per atom tolerance for adaptive refinement (None for fixed resolution)
         :return: dictionary with ASA for each atom
         """
         asa_per_atom = dict()
         for chain in pdb.interfaceParts[0]:
-            for atom, neighbors in ASA.nearAtomsOnChain(chain, pdb.atoms, pdb.ktree):
-                intra_neighbors = [a for a in neighbors if a.pseudoChain == atom.pseudoChain]
-                intra_area = ASA.calcASAforAtom(atom, intra_neighbors)
-                asa_per_atom[atom] = intra_area
+            if engine == ENGINE_SPIRAL:
+                for atom, neighbors in ASA.nearAtomsOnChain(chain, pdb.atoms, pdb.ktree):
+                    intra_neighbors = [a for a in neighbors if a.pseudoChain == atom.pseudoChain]
+                    asa_per_atom[atom] = ASA.calcASAforAtom(atom, intra_neighbors, n_points=n_points)
+                continue
+            atoms, offsets, indices = ASA.nearAtomsOnChainBatch(chain, pdb.atoms, pdb.ktree)
+            atom_indices = [atom.atomIndex for atom in atoms]
+            arrays = pdb.getArrays()
+            offsets, same_pseudo_chain = _filter_csr(offsets, _neighbor_levels(atom_indices, offsets, indices,
+                                                                               arrays) == 0)
+            intra_areas = _batched_areas(engine, *_indexed_neighbors_arrays(atom_indices, offsets,
+                                                                            indices[same_pseudo_chain], arrays),
+                                         n_points=n_points, tolerance=tolerance)
+            asa_per_atom.update(zip(atoms, intra_areas[0].tolist()))
 
         return asa_per_atom
 
@@ -121,10 +168,17 @@ class ASA(object):
                 atom.atomType) + R_WATER * 2 + 1.8) ** 2) if atom2 != atom
                     and atom2.chain in unbound_chain]
 
+        def unbound_neighbors_batch(atoms):
+            offsets, indices = _near_atoms(atoms, ktree)
+            arrays = unbound_protein.getArrays()
+            offsets, selected = _filter_csr(offsets, arrays.chain_mask(unbound_chain)[indices])
+            return _indexed_neighbors_arrays([atom.atomIndex for atom in atoms], offsets, indices[selected], arrays)
+
         mapping = mapUnbound(self.pdb, unbound_protein, self.pdb.interfaceParts[0 if pseudo_chain == 'A' else 1],
                              unbound_chain)
         with self.pdb.getFile("missingASAInterface{0}.txt".format(unbound_protein.name)) as missInterface:
             diff_asa, misses = 0, 0
+            bound_atoms, unbound_atoms = [], []
             for a_bound, asa in self.diffASAperAtom.items():
                 if asa > 0 and a_bound.pseudoChain == pseudo_chain:
                     if a_bound not in mapping:
@@ -133,11 +187,18 @@ class ASA(object):
                         logging.warning('interface atom is not mapped %s', a_bound)
                         misses += 1
                         continue
-                    a_unbound = mapping[a_bound]
-                    neighbors = unbound_neighbors(a_unbound)
-                    intra_area = ASA.calcASAforAtom(a_unbound, neighbors)
-                    inter_area = inter_per_atom[a_bound]
-                    diff_asa += (intra_area - inter_area)
+                    bound_atoms.append(a_bound)
+                    unbound_atoms.append(mapping[a_bound])
+
+            if self.engine == ENGINE_SPIRAL:
+                intra_areas = [ASA.calcASAforAtom(a_unbound, unbound_neighbors(a_unbound), n_points=self.n_points)
+                               for a_unbound in unbound_atoms]
+            else:
+                intra_areas = _batched_areas(self.engine, *unbound_neighbors_batch(unbound_atoms),
+                                             n_points=self.n_points, tolerance=self.tolerance)[0].tolist()
+            for a_bound, intra_area in zip(bound_atoms, intra_areas):
+                inter_area = inter_per_atom[a_bound]
+                diff_asa += (intra_area - inter_area)
 
         logging.info('INTERFACE ASA: %s', str(self.interfaceASA))
         return diff_asa, misses
@@ -173,11 +234,11 @@ class ASA(object):
             neighbors = ASA.nearAtomsOnChain(first_non_missing.chain, pdb.atoms, pdb.kdtree)
             neighbors = [a for a in neighbors if a.resId == resId and a.index < first_non_missing.index]
             # remove asa for the last atom in the residue
-            total_asa -= ASA.calcASAforAtom(first_non_missing, neighbors)
+            total_asa -= ASA.calcASAforAtom(first_non_missing, neighbors, n_points=self.n_points)
             # add to asa area of the remaining tail
             for atom in tail:
                 neighbors = [a for a in ASA.nearAtomsOnChain(atom.chain, pdb.atoms, pdb.kdtree) if a.resId == resId]
-                total_asa += ASA.calcASAforAtom(atom, neighbors)
+                total_asa += ASA.calcASAforAtom(atom, neighbors, n_points=self.n_points)
         return total_asa
 
     def pymol_script(self):
@@ -225,13 +286,41 @@ class ASA(object):
         """
         inter_asa, intra_asa = 0, 0
         interstring_chains = ''.join(self.pdb.interfaceParts)
-        for atom, neighbors in ASA.nearAtomsOnChain(chain, self.pdb.atoms, self.pdb.ktree):
-            # pseudo chain or chain?
-            intra_neighbors = [a for a in neighbors if a.pseudoChain == atom.pseudoChain]
-            inter_optimized = [a for a in neighbors if a.chain in interstring_chains]
-            intraArea = ASA.calcASAforAtom(atom, intra_neighbors, callback=self.print_point)
-            interArea = ASA.calcASAforAtom(atom, inter_optimized)
-
+        n_points = self.n_points
+        if self.engine == ENGINE_SPIRAL:
+            atoms, intra_areas, inter_areas = [], [], []
+            for atom, neighbors in ASA.nearAtomsOnChain(chain, self.pdb.atoms, self.pdb.ktree):
+                # pseudo chain or chain?
+                atoms.append(atom)
+                intra_neighbors = [a for a in neighbors if a.pseudoChain == atom.pseudoChain]
+                inter_neighbors = [a for a in neighbors if a.chain in interstring_chains]
+                intra_areas.append(ASA.calcASAforAtom(atom, intra_neighbors, callback=self.print_point,
+                                                      n_points=n_points))
+                inter_areas.append(ASA.calcASAforAtom(atom, inter_neighbors, n_points=n_points))
+        else:
+            atoms, offsets, indices = ASA.nearAtomsOnChainBatch(chain, self.pdb.atoms, self.pdb.ktree)
+            atom_indices = [atom.atomIndex for atom in atoms]
+            structure = self.pdb.getArrays()
+            offsets, inter_selected = _filter_csr(offsets, structure.chain_mask(interstring_chains)[indices])
+            indices = indices[inter_selected]
+            # intra neighbors are the inter neighbors on the same pseudo chain (level 0)
+            levels = _neighbor_levels(atom_indices, offsets, indices, structure)
+            arrays = _indexed_neighbors_arrays(atom_indices, offsets, indices, structure)
+            if self.single_pass:
+                intra_areas, inter_areas = _batched_areas(self.engine, *arrays, n_points=n_points,
+                                                          neighbor_levels=levels, n_levels=2,
+                                                          callback=self.print_point, tolerance=self.tolerance)
+            else:
+                centers, radii, offsets, neighbor_coords, neighbor_thresholds = arrays
+                intra_offsets, intra_selected = _filter_csr(offsets, levels == 0)
+                intra_areas = _batched_areas(self.engine, centers, radii, intra_offsets,
+                                             neighbor_coords[intra_selected], neighbor_thresholds[intra_selected],
+                                             n_points=n_points, callback=self.print_point,
+                                             tolerance=self.tolerance)[0]
+                inter_areas = _batched_areas(self.engine, *arrays, n_points=n_points, tolerance=self.tolerance)[0]
+            intra_areas, inter_areas = intra_areas.tolist(), inter_areas.tolist()
+
+        for atom, intraArea, interArea in zip(atoms, intra_areas, inter_areas):
             self.interPerAtom[atom] = interArea
             self.diffASAperAtom[atom] = intraArea - interArea
             inter_asa += interArea
@@ -253,23 +342,45 @@ class ASA(object):
         return self.interPerAtom[atom] == 0
 
     @staticmethod
-    def calcASAforAtom(atom, neigbors, callback=None):
+    def calcASAforAtom(atom, neigbors, callback=None, n_points=SPIRAL_POINTS):
+        """ASA of atom by testing each sampled point against each neighbor (spiral engine)
+        :param atom: atom to calculate ASA for
+        :param neigbors: neighbors of the atom
+        :param callback: called with the accessible points
+        :param n_points: number of points sampled on the atom
+        :return: ASA of the atom
+        """
         r = radio_atom(atom.atomType) + R_WATER
-        spiral_points = list(spiral(r, atom))
+        spiral_points = list(spiral(r, atom, n_points))
 
         for atom2 in neigbors:
+            x2, y2, z2 = atom2.coord
             r2 = radio_atom(atom2.atomType)
             threshold = (r2 + R_WATER) ** 2
             for x, y, z in spiral_points[:]:
-                dist = atom2.distanceFromXYZ((x, y, z))
+                dist = (x2 - x) ** 2 + (y2 - y) ** 2 + (z2 - z) ** 2
                 if dist < threshold:  # water is added to two sides of the equation?
                     spiral_points.remove((x, y, z))
         if callback:
             callback(spiral_points[:])
 
-        area = area_calc(r, len(spiral_points), SPIRAL_POINTS)
+        area = area_calc(r, len(spiral_points), n_points)
         return area
 
+    @staticmethod
+    def nearAtomsOnChainBatch(chain, atoms, ktree):
+        """Batched nearAtomsOnChain: neighbors of all the atoms of a chain from a single tree query
+
+        :param chain: chain of the atoms
+        :param atoms: atoms (of the protein)
+        :param ktree: KDTree of the protein atoms
+        :return: atoms of the chain, and their neighbors as offsets and indices into ktree.atoms: the neighbors
+                 of the i'th atom are ktree.atoms[indices[offsets[i]:offsets[i + 1]]]
+        """
+        chain_atoms = [atom for atom in atoms if atom.chain == chain]
+        offsets, indices = _near_atoms(chain_atoms, ktree)
+        return chain_atoms, offsets, indices
+
     @staticmethod
     def nearAtomsOnChain(chain, atoms, ktree):
         extraRad = R_WATER * 2 + 1.8
@@ -312,24 +423,327 @@ def area_calc(radius, point_in, total_points):
     return (4 * pi * radius ** 2) * point_in / total_points
 
 
+def _near_atoms(atoms, ktree):
+    """Neighbors of atoms that may occlude their accessible surface (see ASA.nearAtomsOnChainBatch)
+    :return: offsets and indices into ktree.atoms of the neighbors of each atom (excluding the atom itself)
+    """
+    extra_radius = R_WATER * 2 + 1.8
+    distances = (np.array([radio_atom(atom.atomType) for atom in atoms]) + extra_radius) ** 2
+    offsets, indices = ktree.findByDistanceBatch([atom.coord for atom in atoms], distances)
+    owners = np.repeat(np.arange(len(atoms)), np.diff(offsets))
+    atoms_array = np.empty(len(atoms), dtype=object)
+    atoms_array[:] = atoms
+    offsets, selected = _filter_csr(offsets, ktree.atoms[indices] != atoms_array[owners])
+    return offsets, indices[selected]
+
+
+def _filter_csr(offsets, selected):
+    """Filters neighbors in CSR layout
+    :param offsets: (n + 1,) offsets of the neighbors of each atom
+    :param selected: (m,) boolean array of neighbors to keep
+    :return: new offsets, and the selected mask (to index the neighbors arrays with)
+    """
+    selected = np.asarray(selected, dtype=bool)
+    owners = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    new_offsets = np.zeros(len(offsets), dtype=int)
+    new_offsets[1:] = np.cumsum(np.bincount(owners[selected], minlength=len(offsets) - 1))
+    return new_offsets, selected
+
+
+def _neighbor_levels(atom_indices, offsets, indices, arrays):
+    """Levels of neighbors in CSR layout: 0 for neighbors on the pseudo chain of the atom, otherwise 1
+    :param atom_indices: indices of the atoms
+    :param offsets: (n + 1,) offsets of the neighbors of each atom
+    :param indices: indices of the neighbors
+    :param arrays: AtomArrays of the structure (the atoms and neighbors are indexes into)
+    """
+    owners = np.repeat(np.asarray(atom_indices, dtype=int), np.diff(offsets))
+    return (arrays.pseudo_chains[indices] != arrays.pseudo_chains[owners]).astype(int)
+
+
+def _indexed_neighbors_arrays(atom_indices, offsets, indices, arrays):
+    """Arrays used by exposed_points for atoms and their neighbors in CSR layout
+    :param atom_indices: indices of the atoms
+    :param offsets: (n + 1,) offsets of the neighbors of each atom
+    :param indices: indices of the neighbors
+    :param arrays: AtomArrays of the structure (the atoms and neighbors are indexes into)
+    :return: centers, radii (with water), offsets, neighbors coordinates and neighbors thresholds
+    """
+    atom_indices = np.asarray(atom_indices, dtype=int)
+    radii = arrays.element_values(radio_atom, atom_indices) + R_WATER
+    centers = arrays.coords[atom_indices]
+    neighbor_thresholds = (arrays.element_values(radio_atom, indices) + R_WATER) ** 2
+    neighbor_coords = arrays.coords[indices]
+    return centers, radii, offsets, neighbor_coords, neighbor_thresholds
+
+
+def _callback_points(callback, centers, radii, unit_points, exposed):
+    """Calls callback with the accessible points of each ball"""
+    for center, radius, ball_exposed in zip(centers, radii, exposed):
+        callback([tuple(p) for p in unit_points[ball_exposed] * radius + center])
+
+
+def _batched_exposed(engine, centers, radii, offsets, neighbor_coords, neighbor_thresholds, n_points,
+                     neighbor_levels, n_levels, with_points=False):
+    """Counts accessible points of balls with a batched engine (see exposed_points for the arguments)
+    :param engine: batched ASA engine
+    :param with_points: whether to return also the accessible points in the first level
+    :return: (n_levels, n) array of number of accessible points, and (n, p) boolean array or None
+    """
+    if engine == ENGINE_NUMPY:
+        exposed = exposed_points(centers, radii, offsets, neighbor_coords, neighbor_thresholds,
+                                 sphere_points(n_points), neighbor_levels=neighbor_levels, n_levels=n_levels)
+        return exposed.sum(2), exposed[0] if with_points else None
+    elif engine == ENGINE_BITMASK:
+        occluded = occluded_bitmasks(centers, radii, offsets, neighbor_coords, neighbor_thresholds, n_points,
+                                     neighbor_levels=neighbor_levels, n_levels=n_levels)
+        return n_points - bitmask_count(occluded), ~bitmask_points(occluded[0], n_points) if with_points else None
+    raise ValueError('%s is not a batched ASA engine' % engine)
+
+
+def _select_balls(selected, centers, radii, offsets, neighbor_coords, neighbor_thresholds, neighbor_levels):
+    """Selects subset of balls and their neighbors from the arrays used by exposed_points
+    :param selected: indices of balls to select
+    :return: arrays of the selected balls (centers, radii, offsets, neighbors coordinates, thresholds and levels)
+    """
+    counts = np.diff(offsets)[selected]
+    new_offsets = np.zeros(len(selected) + 1, dtype=int)
+    new_offsets[1:] = np.cumsum(counts)
+    flat = np.repeat(offsets[selected] - new_offsets[:-1], counts) + np.arange(new_offsets[-1])
+    return (centers[selected], radii[selected], new_offsets, neighbor_coords[flat], neighbor_thresholds[flat],
+            neighbor_levels[flat])
+
+
+def _batched_areas(engine, centers, radii, offsets, neighbor_coords, neighbor_thresholds, n_points,
+                   neighbor_levels=None, n_levels=1, callback=None, tolerance=None):
+    """Calculates ASA of balls with a batched engine (see exposed_points for the arguments)
+
+    With tolerance, the balls are first sampled with n_points, and balls occluded (in any level)
+    are sampled again with the next resolution of ADAPTIVE_RESOLUTIONS, until the change in the ASA
+    of the ball is within tolerance or the highest resolution is reached. Balls buried at the coarse resolution
+    are always refined once, since small accessible patches between coarse points are common.
+
+    :param engine: batched ASA engine
+    :param callback: called with the accessible points of each ball in the first level
+    :param tolerance: per ball tolerance (A^2) for adaptive refinement. None for fixed resolution
+    :return: (n_levels, n) array of ASA
+    """
+    levels = neighbor_levels if neighbor_levels is not None else np.zeros(len(neighbor_thresholds), dtype=int)
+    n_exposed, exposed = _batched_exposed(engine, centers, radii, offsets, neighbor_coords, neighbor_thresholds,
+                                          n_points, levels, n_levels, with_points=callback is not None)
+    areas = area_calc(radii, n_exposed, n_points)
+    if tolerance is None:
+        if callback:
+            _callback_points(callback, centers, radii, sphere_points(n_points), exposed)
+        return areas
+
+    resolutions = np.full(len(centers), n_points)
+    exposed = list(exposed) if callback else None
+    refine = np.flatnonzero((n_exposed < n_points).any(0))
+    for resolution in [r for r in ADAPTIVE_RESOLUTIONS if r > n_points]:
+        if len(refine) == 0:
+            break
+        selection = _select_balls(refine, centers, radii, offsets, neighbor_coords, neighbor_thresholds, levels)
+        refined_exposed, refined_points = _batched_exposed(engine, *selection[:-1], n_points=resolution,
+                                                           neighbor_levels=selection[-1], n_levels=n_levels,
+                                                           with_points=callback is not None)
+        refined = area_calc(radii[refine], refined_exposed, resolution)
+        converged = np.abs(refined - areas[:, refine]).max(0) <= tolerance
+        areas[:, refine] = refined
+        resolutions[refine] = resolution
+        if callback:
+            for i, points in zip(refine, refined_points):
+                exposed[i] = points
+        refine = refine[~converged]
+
+    if callback:
+        for center, radius, resolution, ball_exposed in zip(centers, radii, resolutions, exposed):
+            callback([tuple(p) for p in sphere_points(resolution)[ball_exposed] * radius + center])
+    return areas
+
+
+def exposed_points(centers, radii, offsets, neighbor_coords, neighbor_thresholds, unit_points,
+                   neighbor_levels=None, n_levels=1):
+    """Shrake-Rupley test for points sampled on many balls at once
+
+    The neighbors of the i'th ball are neighbor_coords[offsets[i]:offsets[i + 1]].
+    A point is occluded by a neighbor if its squared distance to the neighbor is below the neighbor threshold.
+    Balls are processed in batches of up to BATCH_SIZE (ball, point, neighbor) distances.
+
+    When neighbor_levels is given the occlusion of each neighbor is computed once and
+    result[l] is the accessibility considering only neighbors with level <= l.
+
+    :param centers: (n, 3) array of balls centers
+    :param radii: (n,) array of balls radii
+    :param offsets: (n + 1,) array of offsets into the neighbors arrays
+    :param neighbor_coords: (m, 3) array of neighbors coordinates
+    :param neighbor_thresholds: (m,) array of squared occlusion distance of each neighbor
+    :param unit_points: (p, 3) array of points sampled on unit ball
+    :param neighbor_levels: (m,) optional array of integer levels of the neighbors
+    :param n_levels: number of levels
+    :return: (n, p) boolean array, True for accessible points. (n_levels, n, p) array if neighbor_levels is given
+    """
+    n_balls, n_points = len(centers), len(unit_points)
+    exposed = np.ones((n_levels, n_balls, n_points), dtype=bool)
+    counts = np.diff(offsets)
+    if n_balls == 0 or counts.max() == 0:
+        return exposed if neighbor_levels is not None else exposed[0]
+
+    batch = max(1, BATCH_SIZE // (n_points * counts.max()))
+    for start in range(0, n_balls, batch):
+        end = min(start + batch, n_balls)
+        max_neighbors = counts[start:end].max()
+        if max_neighbors == 0:
+            continue
+        # pad neighbors of each ball to max_neighbors. padded neighbors never occlude
+        slots = np.arange(max_neighbors)
+        valid = slots < counts[start:end, None]
+        neighbor_index = np.where(valid, offsets[start:end, None] + slots, 0)
+        thresholds = np.where(valid, neighbor_thresholds[neighbor_index], -1.0)
+        near = neighbor_coords[neighbor_index]
+
+        points = unit_points * radii[start:end, None, None] + centers[start:end, None, :]
+        dx = near[:, None, :, 0] - points[:, :, None, 0]
+        dy = near[:, None, :, 1] - points[:, :, None, 1]
+        dz = near[:, None, :, 2] - points[:, :, None, 2]
+        occluded = (dx * dx + dy * dy + dz * dz) < thresholds[:, None, :]
+        if neighbor_levels is None:
+            exposed[0, start:end] = ~occluded.any(2)
+            continue
+        levels = neighbor_levels[neighbor_index]
+        for level in range(n_levels):
+            exposed[level, start:end] = ~(occluded & (levels <= level)[:, None, :]).any(2)
+    return exposed if neighbor_levels is not None else exposed[0]
+
+
+def occlusion_table(n_points=SPIRAL_POINTS):
+    """Lookup table from quantized neighbor direction and occlusion cap to occlusion bitmask
+
+    A point u sampled on ball of radius R is occluded by neighbor in direction v and distance d, with squared
+    threshold T, when u.v > (R^2 + d^2 - T) / (2 R d): the occluded points are a spherical cap around v.
+    The table is indexed by direction cell (BITMASK_Z_BINS x BITMASK_PHI_BINS equal area cells) and by cap
+    cosine bin (BITMASK_COS_BINS bins and additional first/last entries for fully/not occluded balls).
+    Bit k of the mask (in 64 bits words) is set when the k'th point of sphere_points is occluded.
+
+    :param n_points: number of points sampled on each ball
+    :return: read only (directions, BITMASK_COS_BINS + 2, words) uint64 array
+    """
+    if n_points not in _BITMASK_TABLES:
+        n_words = (n_points + 63) // 64
+        z = -1 + (np.arange(BITMASK_Z_BINS) + 0.5) * 2.0 / BITMASK_Z_BINS
+        phi = (np.arange(BITMASK_PHI_BINS) + 0.5) * 2 * pi / BITMASK_PHI_BINS
+        rho = np.sqrt(1 - z ** 2)[:, None]
+        directions = np.stack([(rho * np.cos(phi)).ravel(), (rho * np.sin(phi)).ravel(),
+                               np.repeat(z, BITMASK_PHI_BINS)], axis=1)
+        dots = directions.dot(sphere_points(n_points).T)
+        cos_bins = -1 + (np.arange(BITMASK_COS_BINS) + 0.5) * 2.0 / BITMASK_COS_BINS
+
+        table = np.zeros((len(directions), BITMASK_COS_BINS + 2, n_words * 8), dtype=np.uint8)
+        full = np.packbits(np.ones(n_points, dtype=bool), bitorder='little')
+        table[:, 0, :len(full)] = full
+        for i, cos_cap in enumerate(cos_bins):
+            packed = np.packbits(dots > cos_cap, axis=1, bitorder='little')
+            table[:, i + 1, :packed.shape[1]] = packed
+        table = table.view(np.uint64)
+        table.setflags(write=False)
+        _BITMASK_TABLES[n_points] = table
+    return _BITMASK_TABLES[n_points]
+
+
+def occluded_bitmasks(centers, radii, offsets, neighbor_coords, neighbor_thresholds, n_points,
+                      neighbor_levels=None, n_levels=1):
+    """Occlusion bitmasks of points sampled on balls, using the lookup table of occlusion_table
+
+    Approximation of exposed_points (same arguments): instead of testing each point against each
+    neighbor, the neighbor direction and cap are quantized and the occlusion masks of the neighbors
+    are combined with bitwise OR.
+
+    :return: (n_levels, n, words) uint64 array, bit set for occluded points
+    """
+    table = occlusion_table(n_points)
+    n_balls = len(centers)
+    occluded = np.zeros((n_levels, n_balls, table.shape[2]), dtype=np.uint64)
+    counts = np.diff(offsets)
+    if len(neighbor_thresholds) == 0:
+        return occluded
+
+    owner = np.repeat(np.arange(n_balls), counts)
+    vectors = neighbor_coords - centers[owner]
+    distance2 = (vectors ** 2).sum(1)
+    distance = np.sqrt(distance2)
+    radius = radii[owner]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_cap = (radius ** 2 + distance2 - neighbor_thresholds) / (2 * radius * distance)
+        z = vectors[:, 2] / distance
+    # neighbor in the center of the ball occludes everything or nothing
+    cos_cap[distance == 0] = np.where(radius[distance == 0] ** 2 < neighbor_thresholds[distance == 0], -2, 2)
+    z[distance == 0] = 1
+    z_bin = np.clip(((z + 1) * 0.5 * BITMASK_Z_BINS).astype(int), 0, BITMASK_Z_BINS - 1)
+    phi = np.arctan2(vectors[:, 1], vectors[:, 0]) % (2 * pi)
+    phi_bin = np.clip((phi * (BITMASK_PHI_BINS / (2 * pi))).astype(int), 0, BITMASK_PHI_BINS - 1)
+    cos_bin = np.clip(np.floor((cos_cap + 1) * 0.5 * BITMASK_COS_BINS).astype(int) + 1, 0, BITMASK_COS_BINS + 1)
+    masks = table[z_bin * BITMASK_PHI_BINS + phi_bin, cos_bin]
+
+    nonempty = counts > 0
+    starts = offsets[:-1][nonempty]
+    for level in range(n_levels):
+        level_masks = masks if neighbor_levels is None else np.where((neighbor_levels <= level)[:, None], masks, 0)
+        occluded[level, nonempty] = np.bitwise_or.reduceat(level_masks, starts, axis=0)
+    return occluded
+
+
+def bitmask_count(masks):
+    """Number of set bits in bitmasks
+    :param masks: (..., words) uint64 array
+    :return: array of number of set bits in each mask
+    """
+    return _POPCOUNT[masks.view(np.uint8)].reshape(masks.shape[:-1] + (-1,)).sum(-1)
+
+
+def bitmask_points(masks, n_points):
+    """Decodes bitmasks to boolean arrays
+    :param masks: (..., words) uint64 array
+    :param n_points: number of points
+    :return: (..., n_points) boolean array
+    """
+    return np.unpackbits(masks.view(np.uint8), axis=-1, bitorder='little')[..., :n_points].astype(bool)
+
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def sphere_points(n_points=SPIRAL_POINTS):
+    """Points sampled on unit ball by golden section spiral
+
+    The points are computed once for each resolution and cached,
+    callers scale and translate them (points * r + center)
+    :param n_points: number of points (resolution), for example 20, 92 or 492
+    :return: read only (n_points, 3) array
+    """
+    if n_points not in _SPHERE_TEMPLATES:
+        points = np.empty((n_points, 3))
+        move = 0
+        z = 1 - (1.0 / n_points)
+        zMove = (float(2) / n_points)
+        mvPlus = (pi * (3 - sqrt(5)))
+        for k in range(0, n_points):
+            rUnit = sqrt(1 - z * z)
+            points[k] = cos(move) * rUnit, sin(move) * rUnit, z
+            move += mvPlus
+            z -= zMove
+        points.setflags(write=False)
+        _SPHERE_TEMPLATES[n_points] = points
+    return _SPHERE_TEMPLATES[n_points]
+
+
 def spiral(r, atom, n_points=SPIRAL_POINTS):
     """Generator for sampled points in ball
     :param r: radius of the ball
     :param atom: atom
     :param n_points: number of points
     """
-    move = 0
-    z = 1 - (1.0 / n_points)
-    zMove = (float(2) / n_points)
-    mvPlus = (pi * (3 - sqrt(5)))
-    for k in range(0, n_points):
-        rUnit = sqrt(1 - z * z)
-        xCoord = (cos(move) * rUnit) * r + atom.x
-        yCoord = (sin(move) * rUnit) * r + atom.y
-        zCoord = z * r + atom.z
-        move += mvPlus
-        z -= zMove
-        yield (xCoord, yCoord, zCoord)
+    for point in (sphere_points(n_points) * r + (atom.x, atom.y, atom.z)).tolist():
+        yield tuple(point)
 
 
 def main():
@@ -342,13 +756,16 @@ def main():
     parser.add_argument('ubnound_b', help='path to PDB of unbound component')
     parser.add_argument('chain_a', help='Chains in the first component')
     parser.add_argument('chain_b', help='Chains in the second component')
+    parser.add_argument('--engine', choices=ENGINES, default=ENGINE_NUMPY, help='ASA engine')
+    parser.add_argument('--points', type=int, default=SPIRAL_POINTS, help='number of points sampled on each atom')
     args = parser.parse_args()
 
     print('ASA script')
     pdb = PDBReader.readFile(args.complex, interface_parts=args.complex_chains)
     pdbA = PDBReader.readFile(args.ubnound_a)
     pdbB = PDBReader.readFile(args.ubnound_b)
-    asa = ASA(pdb, unbound_a=(pdbA, args.chain_a), unbound_b=(pdbB, args.chain_b))
+    asa = ASA(pdb, unbound_a=(pdbA, args.chain_a), unbound_b=(pdbB, args.chain_b), engine=args.engine,
+              n_points=args.points)
     asa.execute()
 
     print(asa.combinedASA)
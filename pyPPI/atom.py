@@ -1,6 +1,10 @@
 """
 Class representing atom
 """
+from array import array
+
+import numpy as np
+
 ResiduesCodes = {
     'ALA': 'A',
     'ARG': 'R',
@@ -28,15 +32,34 @@ ResiduesCodes = {
 }
 
 
+def coordsBuffer(coords):
+    """Structure wide coordinates buffer, shared by atoms
+    :param coords: list of (x, y, z) coordinates
+    :return: (n, 3) float array and flat view of it (coords_buffer of atom)
+    """
+    coords_array = np.array(coords, dtype=float).reshape(-1, 3)
+    return coords_array, memoryview(coords_array).cast('B').cast('d')
+
+
 class atom(object):
-    def __init__(self, atom_num, atom_symbol, residue, chain, resId, atom_type, coord, atom_index=0, beta_factor=0):
-        self.neighbors = []
+    __slots__ = ('symbol', 'residue', 'chain', 'resId', 'atomType', 'atomNum', 'atomIndex', 'tempFactor',
+                 'pseudoChain', '_coords', '_offset')
+
+    def __init__(self, atom_num, atom_symbol, residue, chain, resId, atom_type, coord, atom_index=0, beta_factor=0,
+                 coords_buffer=None):
+        """
+        Atom. the coordinate is kept in a flat float buffer (shared by the atoms of a structure)
+        :param coord: coordinate (x, y, z), or the row of the atom in coords_buffer
+        :param coords_buffer: flat view of structure wide coordinates array (see coordsBuffer)
+        """
         self.symbol = atom_symbol
         self.residue = residue
         self.chain = chain
         self.resId = int(resId)
-        self.x, self.y, self.z = coord
-        self.coord = coord
+        if coords_buffer is None:
+            self._coords, self._offset = array('d', coord), 0
+        else:
+            self._coords, self._offset = coords_buffer, 3 * coord
         self.atomType = atom_type
         self.atomNum = atom_num
         # used by pdb:
@@ -45,19 +68,39 @@ class atom(object):
 
         self.pseudoChain = None  # instead of chain
 
+    @property
+    def x(self):
+        return self._coords[self._offset]
+
+    @property
+    def y(self):
+        return self._coords[self._offset + 1]
+
+    @property
+    def z(self):
+        return self._coords[self._offset + 2]
+
+    @property
+    def coord(self):
+        offset = self._offset
+        return self._coords[offset], self._coords[offset + 1], self._coords[offset + 2]
+
     def distance(self, other_atom):
         """Computes the distance to other atom
         :param other_atom: atom to compute distance to
         :return: distance
         """
-        return (self.x - other_atom.x) ** 2 + (self.y - other_atom.y) ** 2 + (self.z - other_atom.z) ** 2
+        coords, i = self._coords, self._offset
+        other_x, other_y, other_z = other_atom.coord
+        return (coords[i] - other_x) ** 2 + (coords[i + 1] - other_y) ** 2 + (coords[i + 2] - other_z) ** 2
 
     def distanceFromXYZ(self, XYZ):
         """Computes distance from a coordinate XYZ
         :param XYZ:
         :return:
         """
-        return (self.x - XYZ[0]) ** 2 + (self.y - XYZ[1]) ** 2 + (self.z - XYZ[2]) ** 2
+        coords, i = self._coords, self._offset
+        return (coords[i] - XYZ[0]) ** 2 + (coords[i + 1] - XYZ[1]) ** 2 + (coords[i + 2] - XYZ[2]) ** 2
 
     def resCode(self):
         global ResiduesCodes
@@ -71,6 +114,8 @@ class water(atom):
     """
     Water molecule
     """
+    __slots__ = ()
 
-    def __init__(self, atom_num, atom_symbol, residue, chain, resId, atom_type, coord):
-        super(water, self).__init__(atom_num, atom_symbol, residue, chain, resId, atom_type, coord)
+    def __init__(self, atom_num, atom_symbol, residue, chain, resId, atom_type, coord, coords_buffer=None):
+        super(water, self).__init__(atom_num, atom_symbol, residue, chain, resId, atom_type, coord,
+                                    coords_buffer=coords_buffer)
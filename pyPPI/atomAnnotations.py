@@ -0,0 +1,96 @@
+"""
+Per structure annotations of atoms used by the electrostatic analyses
+
+C-terminal flags, formal charges (by pH) and residue classes of all the atoms of a structure,
+computed from AtomArrays with lookups by unique residue/element/atom name rather than atom by atom.
+"""
+import numpy as np
+
+HYDROPHOBIC_RESIDUES = ['VAL', 'ILE', 'LEU', 'PHE', 'TRP', 'CYS', 'ALA', 'PRO']
+TERMINAL_SYMBOL = 'OXT'  # terminal oxygens (O of residues with OXT) are charged as OXT
+
+
+def formalCharge(residue, element, symbol, pH=7):
+    """
+    Charge of atom by its residue and name
+    :param residue: residue name
+    :param element: element of the atom (atomType)
+    :param symbol: atom name (TERMINAL_SYMBOL for both oxygens of C-terminal residue)
+    :param pH: pH
+    :return: charge of the atom
+    """
+    # how do we assign?
+
+    if residue in ['ASP', 'GLU'] and element == 'O' and symbol != 'O':
+        return -0.5  # -1
+    if symbol == TERMINAL_SYMBOL:
+        return -0.5  # -1
+
+    # arg deloclalized
+    # ARG - NH1 NH2 (not NE and N)
+    # LYS NZ
+    # HIS ND1 NE2
+    if residue == 'LYS' and symbol == 'NZ':
+        return 1.0
+    posRes = ['ARG']
+    if 0.1 < pH <= 6:
+        posRes.append('HIS')
+    if residue in posRes and element == 'N' and symbol not in ['N', 'NE']:
+        return 0.5  # 1
+
+    return 0
+
+
+class AtomAnnotations(object):
+    """
+    Terminal flags, charges and residue classes of atoms, indexed by atom index (as AtomArrays).
+    Charges are computed once for each pH
+    """
+
+    def __init__(self, arrays):
+        """
+        :param arrays: AtomArrays of the atoms
+        """
+        self.arrays = arrays
+        # C-terminal oxygens: OXT and O of residues with OXT
+        residue_keys = np.char.add(np.char.add(arrays.chains, ':'), arrays.res_ids.astype(str))
+        with_oxt = np.unique(residue_keys[arrays.symbols == TERMINAL_SYMBOL])
+        self.terminal = (arrays.symbols == TERMINAL_SYMBOL) | (
+            (arrays.symbols == 'O') & np.isin(residue_keys, with_oxt))
+        self.hydrophobic = np.isin(arrays.residues, HYDROPHOBIC_RESIDUES)
+        self.chargesCache = dict()
+        self.chargeNames, self.chargeInverse = None, None
+
+    def charges(self, pH=7):
+        """Formal charges of the atoms (see formalCharge)
+        :param pH: pH
+        :return: array of charges
+        """
+        if pH not in self.chargesCache:
+            if self.chargeNames is None:
+                # unique (residue, element, atom name) of the atoms, shared by all the pH values
+                arrays = self.arrays
+                symbols = np.where(self.terminal, TERMINAL_SYMBOL, arrays.symbols)
+                names, inverse = np.unique(np.stack([arrays.residues, arrays.elements(), symbols], axis=1).reshape(
+                    -1, 3), axis=0, return_inverse=True)
+                self.chargeNames, self.chargeInverse = names.tolist(), inverse.ravel()
+            table = np.array([formalCharge(residue, element, symbol, pH) for residue, element, symbol in
+                              self.chargeNames] or [0], dtype=float)
+            self.chargesCache[pH] = table[self.chargeInverse]
+        return self.chargesCache[pH]
+
+    def charged(self, pH=7):
+        """Boolean mask of charged atoms"""
+        return self.charges(pH) != 0
+
+    def mask(self, name, pH=7):
+        """Boolean mask of atoms by name of annotation (see PDBReader.getTree)
+        :param name: 'charged' (at pH), 'hydrophobic' or 'terminal'
+        :param pH: pH of charged atoms
+        :return: boolean mask of the atoms
+        """
+        if name == 'charged':
+            return self.charged(pH)
+        if name in ('hydrophobic', 'terminal'):
+            return getattr(self, name)
+        raise ValueError('unknown annotation %s' % name)
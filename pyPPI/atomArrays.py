@@ -0,0 +1,60 @@
+"""
+Columnar (structure of arrays) representation of atoms
+
+The attributes of all the atoms of a structure are stored in contiguous numpy arrays.
+"""
+import numpy as np
+
+NO_PSEUDO_CHAIN = -1  # pseudo chain code of atoms not in the interface parts
+
+
+class AtomArrays(object):
+    """
+    Attributes of atoms as numpy arrays, indexed by atom index
+    """
+
+    def __init__(self, atoms, interface_parts=()):
+        """
+        Builds the arrays from atoms
+        :param atoms: list of atoms
+        :param interface_parts: chains of each part of the interface, for the pseudo chain codes
+        """
+        self.coords = np.array([a.coord for a in atoms], dtype=float).reshape(-1, 3)
+        self.element_symbols, element_codes = np.unique(np.array([a.atomType for a in atoms], dtype=str),
+                                                        return_inverse=True)
+        self.element_codes = element_codes.ravel().astype(np.uint8)
+        self.res_ids = np.array([a.resId for a in atoms], dtype=int)
+        self.chains = np.array([a.chain for a in atoms], dtype=str)
+        self.residues = np.array([a.residue for a in atoms], dtype=str)
+        self.symbols = np.array([a.symbol for a in atoms], dtype=str)
+        self.atom_nums = np.array([a.atomNum for a in atoms], dtype=str)
+        self.b_factors = np.array([a.tempFactor for a in atoms], dtype=float)
+        self.pseudo_chains = np.full(len(atoms), NO_PSEUDO_CHAIN, dtype=np.int8)
+        for j, inter_part in enumerate(interface_parts):
+            self.pseudo_chains[np.isin(self.chains, list(inter_part))] = j
+
+    def __len__(self):
+        return len(self.coords)
+
+    def elements(self):
+        """Element of each atom (as in atom.atomType)"""
+        return self.element_symbols[self.element_codes]
+
+    def chain_mask(self, chains):
+        """Boolean mask of atoms in chains
+        :param chains: string or list of chains
+        """
+        return np.isin(self.chains, list(chains))
+
+    def element_values(self, values, indices=None):
+        """Maps a per element property to atoms
+        :param values: function from element symbol to value (for example radio_atom)
+        :param indices: indices of atoms (all the atoms by default). only the elements of these atoms are mapped
+        :return: array with value for each atom
+        """
+        codes = self.element_codes if indices is None else self.element_codes[indices]
+        used = np.unique(codes)
+        table = np.zeros(len(self.element_symbols))
+        table[used] = [values(self.element_symbols[code]) for code in used]
+        return table[codes]
+
@@ -0,0 +1,215 @@
+"""
+Benchmarks and accuracy of the fast code paths against the reference implementations
+
+Usage:
+    python -m pyPPI.benchmarks asa complex.pdb A B --engine bitmask --points 20
+    python -m pyPPI.benchmarks memory complex.pdb
+    python -m pyPPI.benchmarks parse complex.pdb
+    python -m pyPPI.benchmarks io complex.pdb --cif complex.cif
+"""
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from .ASA import ASA, ENGINES, ENGINE_NUMPY, SPIRAL_POINTS
+from .pdbReader import PDBReader, parseRecords, readRecords
+
+
+def asa_accuracy(pdb, engine, reference=ENGINE_NUMPY, n_points=SPIRAL_POINTS, reference_points=None,
+                 tolerance=None):
+    """Compares the per atom ASA of an engine to a reference engine on the interface chains of a complex
+
+    :param pdb: complex
+    :param engine: ASA engine to evaluate
+    :param reference: reference engine (exact point test by default)
+    :param n_points: number of points sampled on each atom
+    :param reference_points: number of points sampled on each atom by the reference (default n_points)
+    :param tolerance: per atom tolerance for adaptive refinement of the evaluated engine
+    :return: dictionary of accuracy figures:
+        inter_mae/inter_max_error - mean/max absolute error of per atom ASA in the complex
+        atoms_differing - fraction of atoms with different ASA in the complex
+        inter_total_error - relative error of the total ASA of the complex
+        diff_total_error - relative error of the total ASA buried in the interface (combinedASA)
+        interface_agreement - fraction of the atoms with agreement on the interface definition (diff ASA > 0)
+        speedup - time of the reference engine divided by the time of the engine
+    """
+    results = []
+    for asa in [ASA(pdb, engine=reference, n_points=reference_points or n_points),
+                ASA(pdb, engine=engine, n_points=n_points, tolerance=tolerance)]:
+        start = time.time()
+        for chain in ''.join(pdb.interfaceParts):
+            asa.mesh(chain)
+        results.append((asa, time.time() - start))
+        asa.perAtom.close()
+
+    (ref_asa, ref_time), (asa, engine_time) = results
+    atoms = list(ref_asa.interPerAtom)
+    ref_inter = np.array([ref_asa.interPerAtom[a] for a in atoms])
+    inter = np.array([asa.interPerAtom[a] for a in atoms])
+    ref_diff = np.array([ref_asa.diffASAperAtom[a] for a in atoms])
+    diff = np.array([asa.diffASAperAtom[a] for a in atoms])
+    errors = np.abs(inter - ref_inter)
+    return {
+        'atoms': len(atoms),
+        'inter_mae': errors.mean(),
+        'inter_max_error': errors.max(),
+        'atoms_differing': (errors > 1e-9).mean(),
+        'inter_total_error': abs(inter.sum() - ref_inter.sum()) / ref_inter.sum(),
+        'diff_total_error': abs(diff.sum() - ref_diff.sum()) / ref_diff.sum(),
+        'interface_agreement': ((diff > 0) == (ref_diff > 0)).mean(),
+        'speedup': ref_time / engine_time
+    }
+
+
+def structure_memory(path):
+    """Memory of a structure read by PDBReader.readFile (atoms, waters, hetero atoms and k-tree)
+
+    :param path: PDB file
+    :return: dictionary: atoms (number of atoms, waters and hetero atoms) and bytes_per_atom
+             (memory allocated by readFile and still in use, measured with tracemalloc)
+    """
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        pdb = PDBReader.readFile(path)
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    n_atoms = len(pdb.atoms) + len(pdb.waters) + len(pdb.hetatms)
+    return {
+        'atoms': n_atoms,
+        'bytes_per_atom': float(allocated) / n_atoms
+    }
+
+
+def parse_throughput(path, repeat=5):
+    """Throughput of reading PDB file with the line based reader and the vectorized (fast) reader
+
+    :param path: PDB file
+    :param repeat: number of times to read the file (the best time is used)
+    :return: dictionary: megabytes of the file and throughput (MB/s) of readFile, readFileFast,
+             readFileCached (structure in the cache) and of the parsing alone (parseRecords)
+    """
+    import shutil
+    import tempfile
+
+    size = os.path.getsize(path) / 1e6
+    figures = {'size_mb': size}
+    with open(path, 'rb') as pdb_file:
+        data = pdb_file.read()
+    cache_dir = tempfile.mkdtemp()
+    try:
+        PDBReader.readFileCached(path, cache_dir=cache_dir)
+        for name, read in [('readfile_mb_s', lambda: PDBReader.readFile(path)),
+                           ('readfile_fast_mb_s', lambda: PDBReader.readFileFast(path)),
+                           ('readfile_cached_mb_s', lambda: PDBReader.readFileCached(path, cache_dir=cache_dir)),
+                           ('parse_records_mb_s', lambda: parseRecords(data))]:
+            times = []
+            for _ in range(repeat):
+                start = time.time()
+                read()
+                times.append(time.time() - start)
+            figures[name] = size / min(times)
+    finally:
+        shutil.rmtree(cache_dir)
+    figures['speedup'] = figures['readfile_fast_mb_s'] / figures['readfile_mb_s']
+    return figures
+
+
+def io_throughput(path, cif_path=None, repeat=5):
+    """Throughput of reading structure from plain PDB file, compressed PDB files (gzip and bz2) and mmCIF file
+
+    The compressed files are written to temporary directory.
+    :param path: PDB file
+    :param cif_path: mmCIF file of the same structure (optional, also measured compressed with gzip)
+    :param repeat: number of times to read each file (the best time is used)
+    :return: dictionary: megabytes of the files and throughput (MB/s of the uncompressed file)
+             of parsing (readRecords) and of reading PDB object (readFile) for each file
+    """
+    import bz2
+    import gzip
+    import shutil
+    import tempfile
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        files = [('pdb', path)]
+        for extension, opener in [('gz', gzip.open), ('bz2', bz2.open)]:
+            compressed = os.path.join(temp_dir, os.path.basename(path) + '.' + extension)
+            with open(path, 'rb') as source, opener(compressed, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            files.append(('pdb_' + extension, compressed))
+        if cif_path is not None:
+            compressed = os.path.join(temp_dir, os.path.basename(cif_path) + '.gz')
+            with open(cif_path, 'rb') as source, gzip.open(compressed, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            files += [('cif', cif_path), ('cif_gz', compressed)]
+
+        figures = dict()
+        for name, file_path in files:
+            size = os.path.getsize(path if name.startswith('pdb') else cif_path) / 1e6
+            figures[name + '_mb'] = os.path.getsize(file_path) / 1e6
+            for measure, read in [('parse', readRecords), ('readfile', PDBReader.readFile)]:
+                times = []
+                for _ in range(repeat):
+                    start = time.time()
+                    read(file_path)
+                    times.append(time.time() - start)
+                figures['%s_%s_mb_s' % (name, measure)] = size / min(times)
+    finally:
+        shutil.rmtree(temp_dir)
+    return figures
+
+
+def main():
+    """Script for benchmarks"""
+    parser = argparse.ArgumentParser(description='Benchmarks of pyPPI fast code paths')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    asa_parser = subparsers.add_parser('asa', help='accuracy of ASA engine against a reference engine')
+    asa_parser.add_argument('complex', help='PDB file of complex')
+    asa_parser.add_argument('complex_chains', nargs='+', help='Chains in each part of the complex')
+    asa_parser.add_argument('--engine', choices=ENGINES, required=True, help='ASA engine to evaluate')
+    asa_parser.add_argument('--reference', choices=ENGINES, default=ENGINE_NUMPY, help='reference ASA engine')
+    asa_parser.add_argument('--points', type=int, default=SPIRAL_POINTS, help='number of points sampled on each atom')
+    asa_parser.add_argument('--reference-points', type=int, help='number of points sampled by the reference')
+    asa_parser.add_argument('--tolerance', type=float, help='per atom tolerance for adaptive refinement')
+    memory_parser = subparsers.add_parser('memory', help='memory per atom of structure')
+    memory_parser.add_argument('pdb', help='PDB file')
+    parse_parser = subparsers.add_parser('parse', help='throughput of PDB readers')
+    parse_parser.add_argument('pdb', help='PDB file')
+    parse_parser.add_argument('--repeat', type=int, default=5, help='number of reads')
+    io_parser = subparsers.add_parser('io', help='throughput of reading compressed PDB and mmCIF files')
+    io_parser.add_argument('pdb', help='PDB file')
+    io_parser.add_argument('--cif', help='mmCIF file of the same structure')
+    io_parser.add_argument('--repeat', type=int, default=5, help='number of reads')
+    args = parser.parse_args()
+
+    if args.benchmark == 'asa':
+        pdb = PDBReader.readFile(args.complex, interface_parts=args.complex_chains)
+        figures = asa_accuracy(pdb, args.engine, args.reference, args.points, args.reference_points, args.tolerance)
+        for name, value in sorted(figures.items()):
+            print('{0:<20} {1:.4f}'.format(name, value))
+    elif args.benchmark == 'memory':
+        for name, value in sorted(structure_memory(args.pdb).items()):
+            print('{0:<20} {1:.1f}'.format(name, value))
+    elif args.benchmark == 'parse':
+        for name, value in sorted(parse_throughput(args.pdb, args.repeat).items()):
+            print('{0:<20} {1:.2f}'.format(name, value))
+    elif args.benchmark == 'io':
+        for name, value in sorted(io_throughput(args.pdb, args.cif, args.repeat).items()):
+            print('{0:<24} {1:.2f}'.format(name, value))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.WARNING)
+    main()
@@ -20,8 +20,10 @@ def getPeriperial(pdb, atoms):
                         where PDB='%s'""" % pdb.name)
 
     periDict = dict()
+    atoms = set(atoms)
     for chain, resId, symbol, peri in cursor.fetchall():
-        atom = [a for a in atoms if a.symbol == symbol and a.chain == chain and a.resId == resId][0]
+        # first matching atom of atoms
+        atom = next(pdb.atoms[i] for i in pdb.getAtomIndices(chain, resId, symbol) if pdb.atoms[i] in atoms)
         periDict[atom] = peri
     return periDict
 
@@ -1,18 +1,68 @@
+import hashlib
+import json
+import logging
 import os
 import re
+import tempfile
+
+import numpy as np
 
 """
 Reads donor acceptor matrix
 """
 
+RULES_PATH = os.path.join(os.path.dirname(__file__), 'DonAcc2.txt')
+COMPILED_EXTENSION = '.npz'  # compiled rules, next to the matrix
+COMPILED_VERSION = 2  # version of the compiled rules format
+BACKBONE = 'Backbone'
+NO_RULES = ((), ())
+_compiledRules = dict()  # compiled rules by path of matrix (see DonAcceptor.compile), shared by the process
+# integer codes of orbitals (orbital column)
+ORBITAL_SP2, ORBITAL_SP3 = 0, 1
+ORBITAL_CODES = {'sp2': ORBITAL_SP2, 'sp3': ORBITAL_SP3}
+# antecedent of sp3 acceptors (the sp2(acceptor) column gives the antecedent of sp2 acceptors)
+SP3_ANTECEDENTS = {
+    ('TYR', 'OH'): 'CZ',
+    ('SER', 'OG'): 'CB',
+    ('THR', 'OG1'): 'CB',
+    ('CYS', 'SG'): 'CB',
+    ('MET', 'SD'): 'CG'
+}
+
 
 class DonAcceptor:
+    """
+    Donor/acceptor rules of atoms by residue and atom name.
+    The rules are compiled to a dictionary keyed by (residue, atom name). The compiled rules are stored
+    as arrays (npz, without pickled objects) next to the matrix, keyed by the checksum of the matrix,
+    so the matrix is parsed only when it changes, and are shared by the process (see instance)
+    """
     _instance = None
 
-    def __init__(self, path=os.path.join(os.path.dirname(__file__), 'DonAcc2.txt')):
+    def __init__(self, path=RULES_PATH):
+        """
+        :param path: path of the donor acceptor matrix
+        """
+        if path not in _compiledRules:
+            with open(path, 'rb') as daFile:
+                checksum = hashlib.sha1(daFile.read()).hexdigest()
+            compiledPath = os.path.splitext(path)[0] + COMPILED_EXTENSION
+            compiled = DonAcceptor.loadCompiled(compiledPath, checksum)
+            if compiled is None:
+                compiled = DonAcceptor.compile(DonAcceptor.parse(path))
+                DonAcceptor.saveCompiled(compiledPath, checksum, compiled)
+            _compiledRules[path] = compiled
+        self.das, self.rulesByAtom = _compiledRules[path]
+
+    @staticmethod
+    def parse(path):
+        """Parses donor acceptor matrix
+        :param path: path of the matrix
+        :return: list of rules (dictionary from column header to value)
+        """
         daFile = open(path, 'r')
         headers = []
-        self.das = []
+        das = []
         isFirst = True
         for l in daFile.readlines():
             da = [x for x in re.split('(?:\t+|\s{2,})', l) if len(x) > 0]
@@ -39,8 +89,87 @@ class DonAcceptor:
                             pass
                     daVal[h] = da[i]
 
-                self.das.append(daVal)
+                das.append(daVal)
         daFile.close()
+        return das
+
+    @staticmethod
+    def compile(das):
+        """Compiles rules to lookup table by (residue, atom name)
+        :param das: rules (see parse)
+        :return: tuple of:
+                 rules,
+                 dictionary from (residue, atom name) to donor rules and acceptor rules, including the Backbone rules
+                 of the atom name (atoms of other residues are looked up by (Backbone, atom name))
+        """
+        residues, names = [], []
+        for da in das:
+            if da['Residue'] != BACKBONE and da['Residue'] not in residues:
+                residues.append(da['Residue'])
+            if da['Atom'] not in names:
+                names.append(da['Atom'])
+
+        rulesByAtom = dict()
+        for residue in [BACKBONE] + residues:
+            for name in names:
+                matches = [da for da in das if da['Atom'] == name and da['Residue'] in (residue, BACKBONE)]
+                if residue == BACKBONE or any(da['Residue'] == residue for da in matches):
+                    rulesByAtom[(residue, name)] = (tuple(da for da in matches if da['Donor']),
+                                                    tuple(da for da in matches if da['Acceptor']))
+        return das, rulesByAtom
+
+    @staticmethod
+    def saveCompiled(path, checksum, compiled):
+        """Stores compiled rules as arrays. Failures (such as read only directory) are ignored
+        :param path: path of the compiled rules
+        :param checksum: checksum of the matrix the rules are compiled from
+        :param compiled: compiled rules (see compile)
+        """
+        das, rulesByAtom = compiled
+        ruleIndex = dict((id(da), i) for i, da in enumerate(das))
+        arrays = {'version': np.array(COMPILED_VERSION), 'checksum': np.array(checksum),
+                  'rules': np.array(json.dumps(das)),
+                  'keys': np.array(list(rulesByAtom), dtype=str).reshape(-1, 2)}
+        for j, kind in enumerate(['donors', 'acceptors']):
+            rules = [[ruleIndex[id(da)] for da in atomRules[j]] for atomRules in rulesByAtom.values()]
+            arrays[kind] = np.array(sum(rules, []), dtype=int)
+            arrays[kind + '_offsets'] = np.cumsum([0] + [len(atomRules) for atomRules in rules])
+        # write to temporary file and rename, so readers never see partial files
+        try:
+            handle, tempPath = tempfile.mkstemp(suffix=COMPILED_EXTENSION, dir=os.path.dirname(path))
+        except (IOError, OSError):
+            logging.debug('compiled donor acceptor rules are not stored (%s)', path)
+            return
+        try:
+            with os.fdopen(handle, 'wb') as tempFile:
+                np.savez(tempFile, **arrays)
+            os.replace(tempPath, path)
+        except (IOError, OSError):
+            logging.debug('compiled donor acceptor rules are not stored (%s)', path)
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+
+    @staticmethod
+    def loadCompiled(path, checksum):
+        """Loads compiled rules stored by saveCompiled
+        :param path: path of the compiled rules
+        :param checksum: checksum of the matrix
+        :return: compiled rules (see compile), or None if not stored or stale
+        """
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                if int(stored['version']) != COMPILED_VERSION or str(stored['checksum']) != checksum:
+                    return None
+                das = json.loads(str(stored['rules']))
+                keys = [tuple(key) for key in stored['keys'].tolist()]
+                partners = []
+                for kind in ['donors', 'acceptors']:
+                    rules, offsets = stored[kind].tolist(), stored[kind + '_offsets'].tolist()
+                    partners.append([tuple(das[i] for i in rules[start:end])
+                                     for start, end in zip(offsets[:-1], offsets[1:])])
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        return das, dict(zip(keys, zip(*partners)))
 
     @staticmethod
     def instance():
@@ -51,12 +180,6 @@ class DonAcceptor:
             DonAcceptor._instance = DonAcceptor()
         return DonAcceptor._instance
 
-    def __donors(self):
-        return [a for a in self.das if a['Donor']]
-
-    def __acceptors(self):
-        return [a for a in self.das if a['Acceptor']]
-
     def showDonors(self):
         return [a for a in self.das if a['Donor']]
 
@@ -70,20 +193,103 @@ class DonAcceptor:
 
     def __probableDonors(self, atom, nextAtom):
         """ returns atom (and its orbital) and its hydrogen atom for donors"""
-        for donor in self.__donors():
-            if atom.symbol == donor['Atom'] and (donor['Residue'] == atom.residue or donor['Residue'] == 'Backbone'):
-                hAtom = nextAtom(atom, 1)
-                while hAtom.resId == atom.resId:
-                    nAtom = nextAtom(hAtom, 1)
-                    if nAtom == hAtom:
-                        break
-                    hAtom = nAtom
-                    if hAtom.symbol == donor['Hydrogen']:
-                        yield (atom, donor['orbital'], hAtom, donor)
+        for donor in self.rules(atom.residue, atom.symbol)[0]:
+            hAtom = nextAtom(atom, 1)
+            while hAtom.resId == atom.resId:
+                nAtom = nextAtom(hAtom, 1)
+                if nAtom == hAtom:
+                    break
+                hAtom = nAtom
+                if hAtom.symbol == donor['Hydrogen']:
+                    yield (atom, donor['orbital'], hAtom, donor)
 
     def __probableAcceptors(self, atom, nextAtom):
-        for acceptor in self.__acceptors():
-            if atom.symbol == acceptor['Atom'] and (
-                            acceptor['Residue'] == atom.residue or acceptor['Residue'] == 'Backbone'):
-                preAtom = nextAtom(atom, acceptor['preAtom(dist)'])
-                yield (atom, acceptor['orbital'], preAtom, acceptor)
+        for acceptor in self.rules(atom.residue, atom.symbol)[1]:
+            preAtom = nextAtom(atom, acceptor['preAtom(dist)'])
+            yield (atom, acceptor['orbital'], preAtom, acceptor)
+
+    def rules(self, residue, symbol):
+        """Donor and acceptor rules of atom
+        :param residue: residue name of the atom
+        :param symbol: atom name
+        :return: tuple of donor rules and acceptor rules
+        """
+        return self.rulesByAtom.get((residue, symbol)) or self.rulesByAtom.get((BACKBONE, symbol), NO_RULES)
+
+
+class ResidueTopology(object):
+    """
+    Index of residues and donor/acceptor partners of the atoms of a structure, built once per structure.
+    For each donor atom the hydrogens are looked up by name within its residue, and for each acceptor
+    the antecedent atom (by name, or by the preAtom(dist) offset if the name is not found), so partners
+    don't depend on the order of the atoms.
+    Partners are kept in flat arrays (donor_atoms, donor_hydrogens, acceptor_atoms, acceptor_antecedents),
+    with the partners of atom i in range(donor_starts[i], donor_starts[i + 1]) (and same for acceptors),
+    and orbitals of the partners are also coded as integers (donor_orbital_codes, acceptor_orbital_codes)
+    """
+
+    def __init__(self, atoms, donAcc=None):
+        """
+        :param atoms: atoms of the structure (indexed by atomIndex)
+        :param donAcc: DonAcceptor rules (default DonAcceptor.instance())
+        """
+        donAcc = donAcc or DonAcceptor.instance()
+        self.atoms = atoms
+        n = len(atoms)
+        # residue spans: consecutive atoms with same chain and resId
+        self.residue_index = np.zeros(n, dtype=int)
+        starts = []
+        for i, a in enumerate(atoms):
+            if i == 0 or (a.chain, a.resId) != (atoms[i - 1].chain, atoms[i - 1].resId):
+                starts.append(i)
+            self.residue_index[i] = len(starts) - 1
+
+        names = dict()  # (residue span, name): atom index
+        for i, a in enumerate(atoms):
+            names.setdefault((self.residue_index[i], a.symbol), i)
+
+        donors, acceptors = [], []  # (atom, partner, orbital, rule)
+        for i, a in enumerate(atoms):
+            donor_rules, acceptor_rules = donAcc.rules(a.residue, a.symbol)
+            span = self.residue_index[i]
+            hydrogens = set()
+            for rule in donor_rules:
+                hydrogen = names.get((span, rule['Hydrogen']))
+                if hydrogen is not None and hydrogen not in hydrogens:
+                    hydrogens.add(hydrogen)
+                    donors.append((i, hydrogen, rule['orbital'], rule))
+            for rule in acceptor_rules:
+                antecedent = names.get((span, rule['sp2(acceptor)'] if rule['sp2(acceptor)'] != '-' else
+                                        SP3_ANTECEDENTS.get((a.residue, a.symbol))))
+                if antecedent is None and isinstance(rule['preAtom(dist)'], int) and \
+                        0 <= i + rule['preAtom(dist)'] < n:
+                    antecedent = i + rule['preAtom(dist)']
+                if antecedent is not None:
+                    acceptors.append((i, antecedent, rule['orbital'], rule))
+
+        self.donor_atoms, self.donor_hydrogens, self.donor_orbitals, self.donor_rules, self.donor_starts = \
+            ResidueTopology.__partners(donors, n)
+        self.acceptor_atoms, self.acceptor_antecedents, self.acceptor_orbitals, self.acceptor_rules, \
+            self.acceptor_starts = ResidueTopology.__partners(acceptors, n)
+        self.donor_orbital_codes = np.array([ORBITAL_CODES[o] for o in self.donor_orbitals], dtype=np.int8)
+        self.acceptor_orbital_codes = np.array([ORBITAL_CODES[o] for o in self.acceptor_orbitals], dtype=np.int8)
+
+    @staticmethod
+    def __partners(partners, n):
+        atoms = np.array([p[0] for p in partners], dtype=int)
+        return atoms, np.array([p[1] for p in partners], dtype=int), [p[2] for p in partners], \
+               [p[3] for p in partners], np.searchsorted(atoms, np.arange(n + 1))
+
+    def donors(self, atom):
+        """Donor partners of atom, as DonAcceptor.donors
+        :return: generator of atom, orbital, hydrogen atom and donor rule
+        """
+        for j in range(self.donor_starts[atom.atomIndex], self.donor_starts[atom.atomIndex + 1]):
+            yield atom, self.donor_orbitals[j], self.atoms[self.donor_hydrogens[j]], self.donor_rules[j]
+
+    def acceptors(self, atom):
+        """Acceptor partners of atom, as DonAcceptor.acceptors
+        :return: generator of atom, orbital, antecedent atom and acceptor rule
+        """
+        for j in range(self.acceptor_starts[atom.atomIndex], self.acceptor_starts[atom.atomIndex + 1]):
+            yield atom, self.acceptor_orbitals[j], self.atoms[self.acceptor_antecedents[j]], self.acceptor_rules[j]
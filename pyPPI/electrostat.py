@@ -11,10 +11,13 @@ DRIEDING: A Generic Force field for molecular simulations
 from __future__ import print_function
 import math
 
+import numpy as np
+
 from . import DBConfig
-from .kdtree import KDTree
+from .atomAnnotations import formalCharge, HYDROPHOBIC_RESIDUES
 
 VERBOSE = True
+ELECTROSTATIC_CUTOFF = 7  # distance of charges pairs (we could have 6?)
 
 def getHbonds(pdb, pdbName):
     conn = DBConfig.get_connection()
@@ -27,94 +30,122 @@ def getHbonds(pdb, pdbName):
 
     hbonds = []
     for dChain, dResId, dSymbol, aChain, aResId, aSymbol in cursor.fetchall():
-        donorAtom, accAtom = None, None
-        for a in pdb.atoms:
-            if a.chain == dChain and a.resId == dResId and a.symbol == dSymbol:
-                donorAtom = a
-            elif a.chain == aChain and a.resId == aResId and a.symbol == aSymbol:
-                accAtom = a
-        hbonds.append((donorAtom, accAtom))
+        # last matching atoms
+        donors = pdb.getAtomIndices(dChain, dResId, dSymbol)
+        acceptors = pdb.getAtomIndices(aChain, aResId, aSymbol)
+        hbonds.append((pdb.atoms[donors[-1]] if donors else None, pdb.atoms[acceptors[-1]] if acceptors else None))
     return hbonds
 
 
 def eInteraction(Qi, Qj, R):
+    """Coulomb energy of charges Qi and Qj in distance R (scalars or arrays)"""
     kcal_mol_constant = 322.0637
     return kcal_mol_constant * Qi * Qj / (R ** 2)
 
 
-def assignCharge(atom, pH=7):
-    # how do we assign?
-
-    if atom.residue in ['ASP', 'GLU'] and atom.atomType == 'O' and atom.symbol != 'O':
-        return -0.5  # -1
-    if atom.symbol == 'OXT':
-        return -0.5  # -1
+def assignCharge(atom, pH=7, pdb=None):
+    """
+    Charge of atom (see atomAnnotations.formalCharge)
+    :param atom: atom
+    :param pH: pH
+    :param pdb: structure of the atom. the O of C-terminal residue is charged as OXT (the atom alone doesn't
+                tell whether it is terminal), as in calcElectrostatic. Without pdb only OXT is charged
+    :return: charge of the atom
+    """
+    if pdb is not None:
+        return float(pdb.getAnnotations().charges(pH)[atom.atomIndex])
+    return formalCharge(atom.residue, atom.atomType, atom.symbol, pH)
 
-    # arg deloclalized
-    # ARG - NH1 NH2 (not NE and N)
-    # LYS NZ
-    # HIS ND1 NE2
-    if atom.residue == 'LYS' and atom.symbol == 'NZ':
-        return 1.0
-    posRes = ['ARG']
-    if 0.1 < pH <= 6:
-        posRes.append('HIS')
-    if atom.residue in posRes and atom.atomType == 'N' and atom.symbol not in ['N', 'NE']:
-        return 0.5  # 1
 
-    return 0
+def chargedContacts(pdb, interface, charged, exclude_hbonds=False):
+    """
+    Pairs of charged atoms of the interface of the first component and charged atoms of the second component,
+    in distance of ELECTROSTATIC_CUTOFF, found with single batched query
+    :param pdb: pdb
+    :param interface: interface atoms
+    :param charged: boolean mask of the charged atoms (by atomIndex)
+    :param exclude_hbonds: exclude hydrogen bonds (see getHbonds)
+    :return: indices (atomIndex) of the atoms of the first and of the second component, and their distances
+    """
+    # hbonds are excluded (in both directions), hashed as pairs of atom indices
+    hHbonds = set()
+    if exclude_hbonds:
+        for donor, acceptor in getHbonds(pdb, pdb.name):
+            if donor is not None and acceptor is not None:
+                hHbonds.add((donor.atomIndex, acceptor.atomIndex))
+                hHbonds.add((acceptor.atomIndex, donor.atomIndex))
+
+    # charged interface atoms of first component
+    first = np.array(sorted(a.atomIndex for a in interface if a.chain in pdb.interfaceParts[0]), dtype=int)
+    first = first[charged[first]]
+
+    # kd tree of second component, queried for all the atoms of the first component at once
+    ktree = pdb.getTree(chains=pdb.interfaceParts[1])
+    coords = pdb.ktree.coords
+    offsets, neighbors = ktree.findByDistanceBatch(coords[first], ELECTROSTATIC_CUTOFF ** 2)
+    first = np.repeat(first, np.diff(offsets))
+    second = np.array([a.atomIndex for a in ktree.atoms], dtype=int)[neighbors]
+    contact = charged[second]
+    if hHbonds:
+        contact &= np.array([pair not in hHbonds for pair in zip(first.tolist(), second.tolist())], dtype=bool)
+    first, second = first[contact], second[contact]
+
+    diff = coords[first] - coords[second]
+    return first, second, np.sqrt(diff[:, 0] ** 2 + diff[:, 1] ** 2 + diff[:, 2] ** 2)
+
+
+def electrostaticTerms(energies, Qi, Qj, R, count_cutoff_distance=5):
+    """Sum of energies of pairs of charges and counts of pairs of positive/negative charges in short distance
+    :return: energy, number of positive-positive, negative-negative and positive-negative pairs
+    """
+    counted = (R < count_cutoff_distance) & (Qi != 0) & (Qj != 0)
+    pp = int(np.count_nonzero(counted & (Qi > 0) & (Qj > 0)))
+    mm = int(np.count_nonzero(counted & (Qi < 0) & (Qj < 0)))
+    pm = int(np.count_nonzero(counted)) - pp - mm
+    return float(np.sum(energies)), pp, mm, pm
 
 
-def calcElectrostatic(pdb, interface, exclude_hbonds=False, count_cutoff_distance=5):
+def calcElectrostatic(pdb, interface, exclude_hbonds=False, count_cutoff_distance=5, pH=7):
     """
     Calculated possible electro interactions, excluding 1-2 and 1-3 interactions
     (already included in angle and bond interactions
      """
-    CUTOFF_DISTANCE = 7  # we could have 6?
-    if exclude_hbonds:
-        hHbonds = getHbonds(pdb, pdb.name)
-    else:
-        hHbonds = []
-
-    components = []
-    oxtAtoms = [(a.chain, a.resId) for a in pdb.atoms if a.symbol == 'OXT']  # C ter
-    for a in pdb.atoms:
-        if a.symbol == 'O' and (a.chain, a.resId) in oxtAtoms:
-            a.symbol = 'OXT'
-
-    for part in pdb.interfaceParts:
-        components.append([a for a in interface if a.chain in part and assignCharge(a) != 0])
-
-    # fill kd tree with charged atoms from second component
-    comp2 = [atom for atom in pdb.atoms if atom.chain in pdb.interfaceParts[1] and assignCharge(atom) != 0]
-
-    ktree = KDTree.construct_from_data(comp2)
-    electroStat = 0.0
-    pp, pm, mm = 0, 0, 0
-    for atom in components[0]:
-        # interactions are not calculated between atoms bonded to each other (1,2 and 1,3 [hbonds])
-        Qi = assignCharge(atom)
-        if Qi == 0:
-            continue
-
-        nearAtoms = list(ktree.findByDistance(query_point=atom.coord, distance=CUTOFF_DISTANCE ** 2))
-        contact = [con for con in nearAtoms if not (((con, atom) in hHbonds) or ((atom, con) in hHbonds))]
-        for con in contact:
-            Qj = assignCharge(con)
-            if Qj == 0:
-                continue
-            R = math.sqrt(atom.distance(con))
-            electroStat += eInteraction(Qi, Qj, R)
+    charges = pdb.getAnnotations().charges(pH)
+    first, second, R = chargedContacts(pdb, interface, charges != 0, exclude_hbonds)
+    # interactions are not calculated between atoms bonded to each other (1,2 and 1,3 [hbonds])
+    Qi, Qj = charges[first], charges[second]
+    return electrostaticTerms(eInteraction(Qi, Qj, R), Qi, Qj, R, count_cutoff_distance)
 
-            if R < count_cutoff_distance:
-                if Qi > 0 and Qj > 0:
-                    pp += 1
-                elif Qi < 0 and Qj < 0:
-                    mm += 1
-                else:
-                    pm += 1
 
-    return electroStat, pp, mm, pm
+def calcElectrostaticPHScan(pdb, interface, pH_values, exclude_hbonds=False, count_cutoff_distance=5):
+    """
+    calcElectrostatic for several pH values. The contacts of atoms charged in any of the pH values are found once,
+    and for each pH only the pairs of atoms with changed charges (HIS) are re-evaluated
+    :param pdb: pdb
+    :param interface: interface atoms
+    :param pH_values: list of pH values
+    :param exclude_hbonds: exclude hydrogen bonds (see getHbonds)
+    :param count_cutoff_distance: distance of counted pairs
+    :return: list of (pH, energy, pp, mm, pm) for each pH (see calcElectrostatic)
+    """
+    annotations = pdb.getAnnotations()
+    charged = np.zeros(len(pdb.atoms), dtype=bool)
+    for pH in pH_values:
+        charged |= annotations.charged(pH)
+    first, second, R = chargedContacts(pdb, interface, charged, exclude_hbonds)
+
+    table = []
+    charges = np.zeros(len(pdb.atoms))
+    Qi, Qj, energies = np.zeros(len(first)), np.zeros(len(first)), np.zeros(len(first))
+    for pH in pH_values:
+        newCharges = annotations.charges(pH)
+        changed = newCharges != charges
+        affected = changed[first] | changed[second]
+        charges = newCharges
+        Qi[affected], Qj[affected] = charges[first[affected]], charges[second[affected]]
+        energies[affected] = eInteraction(Qi[affected], Qj[affected], R[affected])
+        table.append((pH,) + electrostaticTerms(energies, Qi, Qj, R, count_cutoff_distance))
+    return table
 
 
 def is_hydrophobic(atom):
@@ -123,49 +154,54 @@ def is_hydrophobic(atom):
     :param atom: atom
     :return: True if the atom belongs to hydrophobic residue, otherwise false
     """
-    hydrophobic_res = ['VAL', 'ILE', 'LEU', 'PHE', 'TRP', 'CYS', 'ALA', 'PRO']
-    return atom.residue in hydrophobic_res
+    return atom.residue in HYDROPHOBIC_RESIDUES
 
 
-def calcElectroHydrophobic(pdb, interface):
+def calcElectroHydrophobic(pdb, interface, pH=7):
     """
     Calculated possible electro interactions, excluding 1-2 and 1-3 interactions
     (already included in angle and bond interactions
      """
     HYDROPHOBIC_CHARED_CUTOFF_DISTANCE = 4  # we could have 6?
 
-    oxtAtoms = [(a.chain, a.resId) for a in pdb.atoms if a.symbol == 'OXT']  # C ter
-    for a in pdb.atoms:
-        if a.symbol == 'O' and (a.chain, a.resId) in oxtAtoms:
-            a.symbol = 'OXT'
+    annotations = pdb.getAnnotations()
+    charges = annotations.charges(pH)
+    atoms = pdb.atoms
+    coords = pdb.ktree.coords
+    interface = np.array(sorted(a.atomIndex for a in interface), dtype=int)
+    chains = pdb.getArrays().chains[interface]
 
     hydrophobic_positive = set()
     hydrophobic_negative = set()
     hydroElectroOutput = pdb.getFile('.hydrophobicElectro.txt') if VERBOSE else None
     for part in pdb.interfaceParts:
-        charged_atoms = [a for a in interface if a.chain in part and assignCharge(a) != 0]
-        if not any(charged_atoms):
+        in_part = np.isin(chains, list(part))
+        charged_atoms = interface[in_part & (charges[interface] != 0)]
+        if not len(charged_atoms):
             continue
-        electro_kdtree = KDTree.construct_from_data(charged_atoms)
+        # charged interface atoms of the part near the hydrophobic atoms of the other parts
         other_parts = ''.join([partb for partb in pdb.interfaceParts if partb != part])
-        hydrophobic_partners = [a for a in interface if a.chain in other_parts and is_hydrophobic(a)]
-        for atom in hydrophobic_partners:
-            nearAtoms = list(
-                electro_kdtree.findByDistance(query_point=atom.coord, distance=HYDROPHOBIC_CHARED_CUTOFF_DISTANCE ** 2))
-            for con in nearAtoms:
-                Qi = assignCharge(con)
-                R = math.sqrt(atom.distance(con))
-                if R < HYDROPHOBIC_CHARED_CUTOFF_DISTANCE:
-
-                    if Qi > 0:
-                        hydrophobic_positive.add(
-                            (con.chain, con.resId, con.residue, atom.chain, atom.resId, atom.residue))
-                    elif Qi < 0:
-                        hydrophobic_negative.add((con.chain, con.resId, con.residue, atom.chain, atom.resId,
-                                                  atom.residue))
-                    if hydroElectroOutput:
-                        print(','.join((con.chain, str(con.resId), con.residue, atom.chain, str(atom.resId),
-                                        atom.residue, '%.3f' % R)), file=hydroElectroOutput)
+        hydrophobic_partners = interface[np.isin(chains, list(other_parts)) & annotations.hydrophobic[interface]]
+        # tree of the charged atoms of the part (shared by calls), near atoms are filtered to the interface
+        electro_kdtree = pdb.getTree(chains=part, annotation='charged', pH=pH)
+        offsets, neighbors = electro_kdtree.findByDistanceBatch(coords[hydrophobic_partners],
+                                                                HYDROPHOBIC_CHARED_CUTOFF_DISTANCE ** 2)
+        partners = np.repeat(hydrophobic_partners, np.diff(offsets))
+        near = np.array([a.atomIndex for a in electro_kdtree.atoms], dtype=int)[neighbors]
+        in_interface = np.isin(near, charged_atoms)
+        partners, near = partners[in_interface], near[in_interface]
+        diff = coords[partners] - coords[near]
+        R = np.sqrt(diff[:, 0] ** 2 + diff[:, 1] ** 2 + diff[:, 2] ** 2)
+        for i, j, dist in zip(partners.tolist(), near.tolist(), R.tolist()):
+            atom, con = atoms[i], atoms[j]
+            if dist < HYDROPHOBIC_CHARED_CUTOFF_DISTANCE:
+                if charges[j] > 0:
+                    hydrophobic_positive.add((con.chain, con.resId, con.residue, atom.chain, atom.resId, atom.residue))
+                elif charges[j] < 0:
+                    hydrophobic_negative.add((con.chain, con.resId, con.residue, atom.chain, atom.resId, atom.residue))
+                if hydroElectroOutput:
+                    print(','.join((con.chain, str(con.resId), con.residue, atom.chain, str(atom.resId),
+                                    atom.residue, '%.3f' % dist)), file=hydroElectroOutput)
     if hydroElectroOutput:
         hydroElectroOutput.close()
     return len(hydrophobic_positive), len(hydrophobic_negative)
@@ -5,13 +5,20 @@ import math
 import time
 from math import sqrt
 
-from .donorAcceptor import DonAcceptor
-from .pdbReader import angle
+import numpy as np
+
+from .donorAcceptor import ORBITAL_SP3
+from .pdbReader import angle, cosAngle
 
 MIN_LENGTH_HBOND = 1.97  # The typical length of a hydrogen bond in water is 197 pm
 MAX_HBOND = 3.6 ** 2  # distance**2
 HBOND_ENERGY = -0.01
 WATER_LENGTH = 6
+# HBPlus criteria (see checkHbondHBPlus)
+HBPLUS_MAX_DA = 3.9
+HBPLUS_MAX_HA = 2.5
+HBPLUS_MIN_ANGLE = 0.5 * math.pi  # minimal D-H-A, H-A-AA and D-A-AA angles
+HBPLUS_HIS_DONORS = ('ND1', 'NE2')
 DEBUG = False
 
 
@@ -22,6 +29,7 @@ class hbonds(object):
 
     def __init__(self, pdb):
         self.pdb = pdb
+        self.topology = pdb.getTopology()  # hydrogens and antecedents of donors/acceptors
         self.waterHbonds = 0  # number of hbonds with water on interface
         self.waterInterface = 0  # number of water moleculs on interface
         self.hbondsList = None
@@ -42,49 +50,132 @@ class hbonds(object):
         self.waterInterface = len(interfaceB)
 
     def buildWater(self, interfacesAAA):
+        """
+        Finds waters on the interface (near atoms of pseudo chain A and of pseudo chain B) and their hbonds,
+        with batched radius queries of the interface atoms in the waters KD-tree
+        :param interfacesAAA: interface atoms
+        :return: tuple of hbonds (list of atom and water), closest atoms (and distance) of pseudo chain A and
+                 of pseudo chain B to each water, and the waters on the interface
+        """
         # H2O porting to python
-        minDistanceA = dict()  # most closer atom from A to water
-        minDistanceB = dict()  # same for B
-        # water: (atomA, distance)
-        for water in self.pdb.waters:
-            minDistanceA[water] = (None, 7)
-            minDistanceB[water] = (None, 7)
-
-        probablInterface = set()
-        lessThan35 = dict()  # Hcercano
-        interfaceB = set()
-        # foreach interface atom
-        # for atom in [a for a in self.atoms if a.isInterface()]:
-        for atom in [a for a in interfacesAAA if a.atomType != 'H']:
-            for water in self.pdb.waters:
-                sqDist = sqrt(water.distance(atom))
-                if sqDist == 0:
-                    raise Exception('WARNING: distance between water and atom is zero?')
-                if sqDist < WATER_LENGTH:
-                    if atom.pseudoChain == 'A':  # todo change the A as it could be B or E
-                        probablInterface.add(water)  # (9)
-                        if sqDist < minDistanceA[water][1]:
-                            minDistanceA[water] = atom, sqDist
-                    elif atom.pseudoChain == 'B' and (water in probablInterface) and min(minDistanceA[water][1],
-                                                                                         sqDist) < 3.5:
-                        if sqDist < minDistanceB[water][1]:
-                            minDistanceB[water] = atom, sqDist
-                        interfaceB.add(water)  # 11 in matrix is it same as 9
-                    if sqDist < 3.5:
-                        if water not in lessThan35:
-                            lessThan35[water] = set()
-                        lessThan35[water].add(atom)
-        # atom water tuple list
-        hbonds = []
-        hbondMethod = self.waterHbondHDPlus if self.HDPlusDefinition else self.newWaterHbond
-        for water in interfaceB:
-            for atom in lessThan35[water]:
-                dist = sqrt(water.distance(atom))
-                donor, acceptor = hbondMethod(atom, water, dist)
-                if donor or acceptor:
-                    hbonds.append((atom, water))
-        self.waterHbondsList = hbonds
-        return hbonds, minDistanceA, minDistanceB, interfaceB
+        waters = self.pdb.waters
+        # water: (atom, distance) - most closer atom from A to water and same for B
+        minDistanceA = dict((water, (None, 7)) for water in waters)
+        minDistanceB = dict((water, (None, 7)) for water in waters)
+
+        atomIndices = np.array(sorted(a.atomIndex for a in interfacesAAA if a.atomType != 'H'), dtype=int)
+        if len(waters) == 0 or len(atomIndices) == 0:
+            self.waterHbondsList = []
+            return [], minDistanceA, minDistanceB, set()
+        waterTree = self.pdb.getWaterTree()
+        atomsCoords = self.pdb.ktree.coords[atomIndices]
+        offsets, waterIndices = waterTree.findByDistanceBatch(atomsCoords, WATER_LENGTH ** 2)
+        pairAtoms = np.repeat(np.arange(len(atomIndices)), np.diff(offsets))
+        diff = waterTree.coords[waterIndices] - atomsCoords[pairAtoms]
+        sqDist = np.sqrt(diff[:, 0] ** 2 + diff[:, 1] ** 2 + diff[:, 2] ** 2)
+        if (sqDist == 0).any():
+            raise Exception('WARNING: distance between water and atom is zero?')
+        near = sqDist < WATER_LENGTH
+        pairAtoms, waterIndices, sqDist = atomIndices[pairAtoms[near]], waterIndices[near], sqDist[near]
+        pseudoChains = self.pdb.getArrays().pseudo_chains[pairAtoms]
+
+        # closest atom of A (pseudo chain code 0) to each water (probable interface waters)
+        # todo change the A as it could be B or E
+        minA = np.full(len(waters), 7.0)
+        fromA = pseudoChains == 0
+        for water, atom, dist in hbonds.__closest(waterIndices[fromA], pairAtoms[fromA], sqDist[fromA]):
+            minDistanceA[waters[water]] = self.pdb.atoms[atom], dist
+            minA[water] = dist
+        # atoms of B near water of the probable interface
+        fromB = (pseudoChains == 1) & (minA[waterIndices] < 7) & (np.minimum(minA[waterIndices], sqDist) < 3.5)
+        for water, atom, dist in hbonds.__closest(waterIndices[fromB], pairAtoms[fromB], sqDist[fromB]):
+            minDistanceB[waters[water]] = self.pdb.atoms[atom], dist
+        interfaceB = set(waters[water] for water in np.unique(waterIndices[fromB]).tolist())
+
+        # atom water tuple list, for atoms in distance < 3.5 of interface waters
+        inInterface = np.zeros(len(waters), dtype=bool)
+        inInterface[waterIndices[fromB]] = True
+        candidates = np.flatnonzero((sqDist < 3.5) & inInterface[waterIndices])
+        candidates = candidates[np.lexsort((pairAtoms[candidates], waterIndices[candidates]))]
+        hbondMethod = self.checkWaterHbondsHDPlus if self.HDPlusDefinition else self.checkWaterHbondsDreiding
+        found = hbondMethod(pairAtoms[candidates], waterTree.coords[waterIndices[candidates]], sqDist[candidates])
+        waterHbonds = [(self.pdb.atoms[atom], waters[water]) for atom, water in
+                       zip(pairAtoms[candidates[found]].tolist(), waterIndices[candidates[found]].tolist())]
+        self.waterHbondsList = waterHbonds
+        return waterHbonds, minDistanceA, minDistanceB, interfaceB
+
+    @staticmethod
+    def __closest(waterIndices, atomIndices, distances):
+        """Closest atom to each water of pairs of water and atom
+        :return: list of water, atom and distance (for waters in the pairs)
+        """
+        order = np.lexsort((atomIndices, distances, waterIndices))
+        first = order[np.r_[True, waterIndices[order][1:] != waterIndices[order][:-1]]] if len(order) else order
+        return zip(waterIndices[first].tolist(), atomIndices[first].tolist(), distances[first].tolist())
+
+    def checkWaterHbondsHDPlus(self, atoms, waterCoords, dists):
+        """
+            Batched waterHbondHDPlus: checks hbonds of many pairs of atom and water according to hbplus definition
+            :param atoms: indices (atomIndex) of the atoms
+            :param waterCoords: coordinates of the waters of the pairs
+            :param dists: distances between the atoms and the waters
+            :return: boolean array, True for pairs with hbond
+        """
+        topology = self.topology
+        coords = self.pdb.ktree.coords
+        minCos = math.cos(HBPLUS_MIN_ANGLE)  # angle > HBPLUS_MIN_ANGLE iff its cosine < minCos
+        arrays = self.pdb.getArrays()
+        found = (arrays.residues[atoms] == 'HIS') & np.isin(arrays.symbols[atoms], HBPLUS_HIS_DONORS) & \
+                (dists > math.sqrt(2))
+
+        # atom is the donor
+        pair, donorPartner = hbonds.__expandPartners(np.arange(len(atoms)), topology.donor_starts[atoms],
+                                                     topology.donor_starts[atoms + 1])
+        H = coords[topology.donor_hydrogens[donorPartner]]
+        DH, HA = hbonds.__distances(coords[atoms[pair]], H), hbonds.__distances(waterCoords[pair], H)
+        found[pair[(HA < HBPLUS_MAX_HA) & (cosAngle(DH, dists[pair], HA) < minCos)]] = True
+
+        # atom is the acceptor (H-A-AA is the D-A-AA angle: the water is the donor)
+        pair, acceptorPartner = hbonds.__expandPartners(np.arange(len(atoms)), topology.acceptor_starts[atoms],
+                                                        topology.acceptor_starts[atoms + 1])
+        AA = coords[topology.acceptor_antecedents[acceptorPartner]]
+        preAtomAcceptor = hbonds.__distances(AA, coords[atoms[pair]])
+        preAtomDonor = hbonds.__distances(AA, waterCoords[pair])
+        found[pair[(dists[pair] < 3.5) & (cosAngle(preAtomAcceptor, preAtomDonor, dists[pair]) < minCos)]] = True
+        return found & (dists <= HBPLUS_MAX_DA)
+
+    def checkWaterHbondsDreiding(self, atoms, waterCoords, dists):
+        """
+            Batched newWaterHbond: checks hbonds of many pairs of atom and water by DREIDING energy
+            (water orbital is sp3)
+            :param atoms: indices (atomIndex) of the atoms
+            :param waterCoords: coordinates of the waters of the pairs
+            :param dists: distances between the atoms and the waters
+            :return: boolean array, True for pairs with hbond
+        """
+        topology = self.topology
+        coords = self.pdb.ktree.coords
+        found = np.zeros(len(atoms), dtype=bool)
+
+        # atom is the donor
+        pair, donorPartner = hbonds.__expandPartners(np.arange(len(atoms)), topology.donor_starts[atoms],
+                                                     topology.donor_starts[atoms + 1])
+        H = coords[topology.donor_hydrogens[donorPartner]]
+        DH, HA = hbonds.__distances(coords[atoms[pair]], H), hbonds.__distances(waterCoords[pair], H)
+        f = hbonds.angularFactors(topology.donor_orbital_codes[donorPartner], ORBITAL_SP3,
+                                  cosAngle(DH, dists[pair], HA), math.cos(120 / 180 * math.pi))
+        found[pair[self.leenardJones(dists[pair]) * f < HBOND_ENERGY]] = True
+
+        # atom is the acceptor
+        pair, acceptorPartner = hbonds.__expandPartners(np.arange(len(atoms)), topology.acceptor_starts[atoms],
+                                                        topology.acceptor_starts[atoms + 1])
+        AA = coords[topology.acceptor_antecedents[acceptorPartner]]
+        cosPhi = cosAngle(hbonds.__distances(AA, coords[atoms[pair]]), hbonds.__distances(AA, waterCoords[pair]),
+                          dists[pair])
+        f = hbonds.angularFactors(ORBITAL_SP3, topology.acceptor_orbital_codes[acceptorPartner], math.cos(math.pi),
+                                  cosPhi)
+        found[pair[self.leenardJones(dists[pair]) * f < HBOND_ENERGY]] = True
+        return found & (dists >= MIN_LENGTH_HBOND)
 
     def waterHbondHDPlus(self, atom, water, dist):
         """
@@ -104,7 +195,7 @@ class hbonds(object):
             if dist > math.sqrt(2):
                 return (True, True)
 
-        for donor, donoarOrbital, hAtom, testD in DonAcceptor.donors(atom, self.pdb.getNextAtoms):
+        for donor, donoarOrbital, hAtom, testD in self.topology.donors(atom):
             DH = sqrt(donor.distance(hAtom))
             HA = sqrt(water.distance(hAtom))
             theta = angle(DH, dist, HA)
@@ -112,7 +203,7 @@ class hbonds(object):
             if HA < MAX_HA and (theta > MIN_DHA):  # and phi>MIN_H_A_AA
                 return (True, True)
 
-        for acceptor, acceptorOrbital, preAtom, testA in DonAcceptor.acceptors(atom, self.pdb.getNextAtoms):
+        for acceptor, acceptorOrbital, preAtom, testA in self.topology.acceptors(atom):
             # theta = math.pi #180
             phi = angle(sqrt(preAtom.distance(acceptor)), sqrt(preAtom.distance(water)), dist)
             preAtomAcceptor = sqrt(preAtom.distance(acceptor))
@@ -130,7 +221,7 @@ class hbonds(object):
         if dist < MIN_LENGTH_HBOND:
             logging.info('WARNING no hbond between', atom, water, '. distance is too small: {0:.3f}'.format(dist))
             return False, 0
-        for donor, donoarOrbital, hAtom, testD in DonAcceptor.donors(atom, self.pdb.getNextAtoms):
+        for donor, donoarOrbital, hAtom, testD in self.topology.donors(atom):
             acceptorOrbital = 'sp3'  # water is sp3
             DH = sqrt(atom.distance(hAtom))
             HA = sqrt(water.distance(hAtom))
@@ -145,7 +236,7 @@ class hbonds(object):
                     eHB = energy
                 haveHbond = True
 
-        for acceptor, acceptorOrbital, preAtom, testA in DonAcceptor.acceptors(atom, self.pdb.getNextAtoms):
+        for acceptor, acceptorOrbital, preAtom, testA in self.topology.acceptors(atom):
             donoarOrbital = 'sp3'  # water is sp3
             theta = math.pi  # 180
             phi = angle(sqrt(preAtom.distance(acceptor)), sqrt(preAtom.distance(water)), dist)
@@ -165,26 +256,165 @@ class hbonds(object):
         """
 
         logging.debug('start hbonds for interface atoms')
-        i = time.clock()
-        donorsAcceptors = set()
-        for atom in [a for a in interfaces]:
-            # dont ignore by chain - both inter and intra
-            for atom2 in [a for a in self.pdb.ktree.findByDistance(query_point=atom.coord, distance=MAX_HBOND) if
-                          a != atom]:
-                # when atom/atom2 can be donor/acceptor or acceptor/donor
-                hbondMethod = self.checkHbondHBPlus if self.HDPlusDefinition else self.checkHbond
-                hbond, eHb = hbondMethod(atom, atom2)
-                if hbond:
-                    donorsAcceptors.add((atom, atom2, eHb))
-                hbond, eHb = hbondMethod(atom2, atom)
-                if hbond:
-                    donorsAcceptors.add((atom2, atom, eHb))
+        i = time.time()
+        # dont ignore by chain - both inter and intra
+        donors, acceptors = self.candidatePairs(interfaces)
+        atoms = self.pdb.atoms
+        if self.HDPlusDefinition:
+            found = self.checkHbondsHBPlus(donors, acceptors)
+            donorsAcceptors = set((atoms[d], atoms[a], 0) for d, a in zip(donors[found].tolist(),
+                                                                          acceptors[found].tolist()))
+        else:
+            found, energies = self.checkHbondsDreiding(donors, acceptors)
+            donorsAcceptors = set((atoms[d], atoms[a], eHb) for d, a, eHb in zip(
+                donors[found].tolist(), acceptors[found].tolist(), energies[found].tolist()))
 
         self.hbondsOutput(donorsAcceptors)
-        logging.debug('end hbonds (%s secs)', (time.clock() - i))
+        logging.debug('end hbonds (%s secs)', (time.time() - i))
         logging.info('Found %s hbonds', len(donorsAcceptors))
         return donorsAcceptors
 
+    def candidatePairs(self, interfaces):
+        """Candidate pairs of hbonds: interface atoms and atoms in distance of MAX_HBOND from them, in both directions
+        :param interfaces: interface atoms
+        :return: arrays of indices (atomIndex) of the possible donors and acceptors of the pairs
+        """
+        interface = np.array(sorted(a.atomIndex for a in interfaces), dtype=int)
+        ktree = self.pdb.ktree
+        offsets, neighbors = ktree.findByDistanceBatch(ktree.coords[interface], MAX_HBOND)
+        first = np.repeat(interface, np.diff(offsets))
+        pairs = np.concatenate([np.stack([first, neighbors], axis=1), np.stack([neighbors, first], axis=1)])
+        pairs = np.unique(pairs[pairs[:, 0] != pairs[:, 1]], axis=0).reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+
+    def checkHbondsHBPlus(self, donors, acceptors):
+        """
+            Batched checkHbondHBPlus: checks many pairs of possible donor and acceptor according to hbplus definition,
+            with the geometry of all the hydrogens/antecedents of the pairs computed as arrays
+            :param donors: indices (atomIndex) of the possible donors
+            :param acceptors: indices of the possible acceptors (of the same pairs)
+            :return: boolean array, True for pairs with hbond
+        """
+        topology = self.topology
+        coords = self.pdb.ktree.coords
+        minCos = math.cos(HBPLUS_MIN_ANGLE)  # angle > HBPLUS_MIN_ANGLE iff its cosine < minCos
+        found = np.zeros(len(donors), dtype=bool)
+
+        # HIS donors (even without hydrogens) to any acceptor partner
+        arrays = self.pdb.getArrays()
+        his = np.flatnonzero((arrays.residues[donors] == 'HIS') & np.isin(arrays.symbols[donors], HBPLUS_HIS_DONORS))
+        pair, acceptorPartner = hbonds.__expandPartners(his, topology.acceptor_starts[acceptors[his]],
+                                                        topology.acceptor_starts[acceptors[his] + 1])
+        D, A = coords[donors[pair]], coords[acceptors[pair]]
+        AA = coords[topology.acceptor_antecedents[acceptorPartner]]
+        dist, preAtomAcceptor, preAtomDonor = hbonds.__distances(A, D), hbonds.__distances(AA, A), \
+                                              hbonds.__distances(AA, D)
+        valid = (dist > math.sqrt(2)) & (dist < HBPLUS_MAX_DA) & \
+                (cosAngle(dist, preAtomDonor, preAtomAcceptor) < minCos)
+        found[pair[valid]] = True
+
+        # each hydrogen of the donor with each antecedent of the acceptor
+        pair, donorPartner, acceptorPartner = self.__combinations(donors, acceptors, np.flatnonzero(~found))
+        D, A = coords[donors[pair]], coords[acceptors[pair]]
+        H = coords[topology.donor_hydrogens[donorPartner]]
+        AA = coords[topology.acceptor_antecedents[acceptorPartner]]
+        DH, HA, dist = hbonds.__distances(D, H), hbonds.__distances(A, H), hbonds.__distances(A, D)
+        preAtomAcceptor, preAtomDonor = hbonds.__distances(AA, A), hbonds.__distances(AA, D)
+        valid = (dist < HBPLUS_MAX_DA) & (HA < HBPLUS_MAX_HA)
+        valid &= cosAngle(DH, dist, HA) < minCos  # D-H-A
+        valid &= cosAngle(preAtomAcceptor, hbonds.__distances(AA, H), HA) < minCos  # H-A-AA
+        valid &= cosAngle(dist, preAtomDonor, preAtomAcceptor) < minCos  # D-A-AA
+        found[pair[valid]] = True
+        return found
+
+    def checkHbondsDreiding(self, donors, acceptors):
+        """
+            Batched checkHbond: energy of hbonds of many pairs of possible donor and acceptor (DREIDING),
+            evaluated over arrays of the geometries of all the hydrogens/antecedents of the pairs
+            :param donors: indices (atomIndex) of the possible donors
+            :param acceptors: indices of the possible acceptors (of the same pairs)
+            :return: boolean array, True for pairs with hbond, and energy of the pairs (minimal energy of the pair
+                     below HBOND_ENERGY, 0 for pairs without hbond)
+        """
+        topology = self.topology
+        coords = self.pdb.ktree.coords
+        pair, donorPartner, acceptorPartner = self.__combinations(donors, acceptors, np.arange(len(donors)))
+        D, A = coords[donors[pair]], coords[acceptors[pair]]
+        H = coords[topology.donor_hydrogens[donorPartner]]
+        AA = coords[topology.acceptor_antecedents[acceptorPartner]]
+        DH, HA, dist = hbonds.__distances(D, H), hbonds.__distances(A, H), hbonds.__distances(A, D)
+        cosTheta = cosAngle(DH, dist, HA)
+        cosPhi = cosAngle(hbonds.__distances(AA, A), hbonds.__distances(AA, H), HA)
+        f = hbonds.angularFactors(topology.donor_orbital_codes[donorPartner],
+                                  topology.acceptor_orbital_codes[acceptorPartner], cosTheta, cosPhi)
+        energy = self.leenardJones(dist) * f
+
+        found = np.zeros(len(donors), dtype=bool)
+        energies = np.zeros(len(donors))
+        bonded = energy < HBOND_ENERGY
+        found[pair[bonded]] = True
+        np.minimum.at(energies, pair[bonded], energy[bonded])
+        # donor and acceptor too close - no hbond
+        tooClose = pair[dist < MIN_LENGTH_HBOND]
+        found[tooClose] = False
+        energies[tooClose] = 0
+        return found, energies
+
+    @staticmethod
+    def angularFactors(dOrbitals, aOrbitals, cosTheta, cosPhi):
+        """Batched fAngleDep
+        :param dOrbitals: orbital codes of the donors (ORBITAL_SP2/ORBITAL_SP3)
+        :param aOrbitals: orbital codes of the acceptors
+        :param cosTheta: cosine of D-H-A angles
+        :param cosPhi: cosine of H-A-AA angles
+        :return: angular factors
+        """
+        PhiFixRad = 109.5 / 180 * math.pi
+        cosRad90 = math.cos(0.5 * math.pi)  # angle > 90 iff its cosine < cosRad90
+
+        dOrbitals, aOrbitals, cosTheta, cosPhi = np.broadcast_arrays(dOrbitals, aOrbitals, cosTheta, cosPhi)
+        phi = np.arccos(cosPhi)
+        dSp3, aSp3 = dOrbitals == ORBITAL_SP3, aOrbitals == ORBITAL_SP3
+        thetaValid = cosTheta < cosRad90
+        return np.select([dSp3 & aSp3, dSp3 & ~aSp3, ~dSp3 & aSp3, ~dSp3 & ~aSp3], [
+            np.where(thetaValid & (phi - PhiFixRad < 0.5 * math.pi), cosTheta ** 2 * np.cos(phi - PhiFixRad) ** 2, 0),
+            np.where(cosPhi < cosRad90, cosTheta ** 2 * cosPhi ** 2, 0),
+            np.where(thetaValid, cosTheta ** 4, 0),
+            np.where(thetaValid, cosTheta ** 2 * cosPhi ** 2, 0)
+        ])
+
+    def __combinations(self, donors, acceptors, pairs):
+        """Combinations of the hydrogens of the donors and the antecedents of the acceptors of pairs
+        :param pairs: indices of the pairs (in donors/acceptors)
+        :return: pair of each combination, and index of the donor partner and of the acceptor partner
+                 in the arrays of the topology
+        """
+        topology = self.topology
+        dStarts, dEnds = topology.donor_starts[donors[pairs]], topology.donor_starts[donors[pairs] + 1]
+        aStarts, aEnds = topology.acceptor_starts[acceptors[pairs]], topology.acceptor_starts[acceptors[pairs] + 1]
+        aCount = aEnds - aStarts
+        position, combination = hbonds.__expandPartners(np.arange(len(pairs)), np.zeros(len(pairs), dtype=int),
+                                                        (dEnds - dStarts) * aCount)
+        donorPartner = dStarts[position] + combination // aCount[position]
+        acceptorPartner = aStarts[position] + combination % aCount[position]
+        return pairs[position], donorPartner, acceptorPartner
+
+    @staticmethod
+    def __expandPartners(pairs, starts, ends):
+        """Repeats each pair for each partner in range(starts[i], ends[i])
+        :return: pairs and partners arrays
+        """
+        counts = ends - starts
+        pair = np.repeat(pairs, counts)
+        partner = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - starts, counts)
+        return pair, partner
+
+    @staticmethod
+    def __distances(first, second):
+        """Distances between arrays of coordinates (summed in the order of atom.distance)"""
+        diff = first - second
+        return np.sqrt(diff[:, 0] ** 2 + diff[:, 1] ** 2 + diff[:, 2] ** 2)
+
     def fAngleDep(self, dOrbital, aOrbital, theta, phi):
         PhiFixRad = 109.5 / 180 * math.pi
         Rad90 = 0.5 * math.pi
@@ -226,19 +456,19 @@ class hbonds(object):
         return D0 * (5 * (R0 / r) ** 12 - 6 * (R0 / r) ** 10)
 
     def checkHbondHBPlus(self, pDonor, pAcceptor):
-        MAX_DA = 3.9
-        MAX_HA = 2.5
-        MIN_DHA = 0.5 * math.pi
-        MIN_D_A_AA = 0.5 * math.pi
-        MIN_H_A_AA = 0.5 * math.pi
+        MAX_DA = HBPLUS_MAX_DA
+        MAX_HA = HBPLUS_MAX_HA
+        MIN_DHA = HBPLUS_MIN_ANGLE
+        MIN_D_A_AA = HBPLUS_MIN_ANGLE
+        MIN_H_A_AA = HBPLUS_MIN_ANGLE
 
         """
             This method checks for hbond according to definition of hbplus
             see definition in: http://www.csb.yale.edu/userguides/datamanip/hbplus/hbplus_descrip.html
             this method doesn't give enegy just a boolean
         """
-        if pDonor.residue == 'HIS' and pDonor.symbol in ['ND1', 'NE2']:
-            for acceptor, acceptorOrbital, preAtom, testA in DonAcceptor.acceptors(pAcceptor, self.pdb.getNextAtoms):
+        if pDonor.residue == 'HIS' and pDonor.symbol in HBPLUS_HIS_DONORS:
+            for acceptor, acceptorOrbital, preAtom, testA in self.topology.acceptors(pAcceptor):
                 dist = sqrt(pAcceptor.distance(pDonor))
                 preAtomAcceptor = sqrt(preAtom.distance(acceptor))
                 preAtomDonor = sqrt(preAtom.distance(pDonor))
@@ -246,8 +476,8 @@ class hbonds(object):
                 if dist > math.sqrt(2) and dist < 3.9 and d_a_aa > MIN_D_A_AA:
                     return (True, 0)
 
-        for donor, donoarOrbital, hAtom, testD in DonAcceptor.donors(pDonor, self.pdb.getNextAtoms):
-            for acceptor, acceptorOrbital, preAtom, testA in DonAcceptor.acceptors(pAcceptor, self.pdb.getNextAtoms):
+        for donor, donoarOrbital, hAtom, testD in self.topology.donors(pDonor):
+            for acceptor, acceptorOrbital, preAtom, testA in self.topology.acceptors(pAcceptor):
                 DH = sqrt(donor.distance(hAtom))
                 HA = sqrt(pAcceptor.distance(hAtom))
                 dist = sqrt(pAcceptor.distance(donor))
@@ -275,8 +505,8 @@ class hbonds(object):
         haveHbond = False
         eHB = 0
         # if the atom is the donor and water is the acceptor
-        for donor, donoarOrbital, hAtom, testD in DonAcceptor.donors(pDonor, self.pdb.getNextAtoms):
-            for acceptor, acceptorOrbital, preAtom, testA in DonAcceptor.acceptors(pAcceptor, self.pdb.getNextAtoms):
+        for donor, donoarOrbital, hAtom, testD in self.topology.donors(pDonor):
+            for acceptor, acceptorOrbital, preAtom, testA in self.topology.acceptors(pAcceptor):
                 DH = sqrt(donor.distance(hAtom))
                 HA = sqrt(pAcceptor.distance(hAtom))
                 dist = sqrt(pAcceptor.distance(donor))
@@ -10,19 +10,23 @@ class KDTree():
     Wrapper for KDtree for atoms
     """
 
-    def __init__(self, atoms):
-        self._atoms = np.array(atoms)
-        coord_data = np.array([atom.coord for atom in atoms])
+    def __init__(self, atoms, coords=None):
+        self._atoms = np.empty(len(atoms), dtype=object)
+        self._atoms[:] = atoms
+        if coords is None:
+            coords = [atom.coord for atom in atoms]
+        coord_data = np.array(coords, dtype=float).reshape(-1, 3)
         self._tree = _KDTree(coord_data)
 
     @staticmethod
-    def construct_from_data(atoms):
+    def construct_from_data(atoms, coords=None):
         """
         Constructs KDTree from list of atoms
         :param atoms: list of atoms
+        :param coords: coordinates of the atoms (optional, taken from the atoms by default)
         :return: KDtree
         """
-        tree = KDTree(atoms)
+        tree = KDTree(atoms, coords)
         return tree
 
     def findByDistance(self, query_point, distance):
@@ -35,6 +39,51 @@ class KDTree():
         points = self._tree.query_ball_point(query_point, _sqrt(distance))
         return self._atoms[points]
 
+    def findByDistanceBatch(self, query_points, distances):
+        """
+        Query points around many query points with single tree to tree query
+        :param query_points: points to look around
+        :param distances: threshold for points selection (squared distance, as in findByDistance),
+                          for each query point or for all of them
+        :return: offsets and indices: indices of the points within sqrt(distances[i]) of the i'th query point
+                 are indices[offsets[i]:offsets[i + 1]] (sorted)
+        """
+        query_points = np.array(query_points, dtype=float).reshape(-1, 3)
+        radii = _sqrt(np.broadcast_to(np.asarray(distances, dtype=float), (len(query_points),)))
+        offsets = np.zeros(len(query_points) + 1, dtype=int)
+        if len(query_points) == 0 or len(self._atoms) == 0:
+            return offsets, np.zeros(0, dtype=int)
+        pairs = _KDTree(query_points).sparse_distance_matrix(self._tree, radii.max(), output_type='ndarray')
+        queries, indices = pairs['i'].astype(int), pairs['j'].astype(int)
+        within = pairs['v'] <= radii[queries]
+        queries, indices = queries[within], indices[within]
+        order = np.argsort(queries * len(self._atoms) + indices)
+        offsets[1:] = np.cumsum(np.bincount(queries, minlength=len(query_points)))
+        return offsets, indices[order]
+
+    def findPairsByDistance(self, other, distance):
+        """
+        Query pairs of points of this tree and other tree with single tree to tree query
+        :param other: KDTree to pair with
+        :param distance: threshold for pairs selection (squared distance, as in findByDistance)
+        :return: indices of the points of the pairs in this tree and in the other tree (sorted)
+        """
+        if len(self._atoms) == 0 or len(other.atoms) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        pairs = self._tree.sparse_distance_matrix(other._tree, _sqrt(distance), output_type='ndarray')
+        order = np.lexsort((pairs['j'], pairs['i']))
+        return pairs['i'][order].astype(int), pairs['j'][order].astype(int)
+
+    @property
+    def atoms(self):
+        """Atoms of the tree, as array indexed by findByDistanceBatch"""
+        return self._atoms
+
+    @property
+    def coords(self):
+        """Coordinates of the atoms of the tree"""
+        return self._tree.data
+
     def findNearest(self, query_point, num):
         """
         Finds nearest point to a query point
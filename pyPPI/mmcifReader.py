@@ -0,0 +1,271 @@
+"""
+Reader of structures in PDBx/mmCIF format
+
+Only the categories used by PDBReader are read: entity/entity_poly (compounds) and atom_site (atoms).
+The file is read line by line (it may be a decompressing stream), and the atom_site rows are split to columns
+in blocks of lines with numpy, so large entries (that do not fit the PDB format) are read without holding the text.
+
+References:
+*http://mmcif.wwpdb.org/docs/user-guide/guide.html - mmCIF user guide
+"""
+import logging
+import re
+
+import numpy as np
+
+from .pdbReader import RECORD_ATOM, RECORD_WATER, RECORD_HETATM
+
+ROWS_PER_BLOCK = 65536  # lines of atom_site split at once
+# atom_site items of each field of the records (alternatives by priority). auth items are as in PDB files
+ATOM_SITE_ITEMS = [
+    ('group', ['group_PDB']),
+    ('atom_num', ['id']),
+    ('symbol', ['auth_atom_id', 'label_atom_id']),
+    ('alt_loc', ['label_alt_id']),
+    ('residue', ['auth_comp_id', 'label_comp_id']),
+    ('chain', ['auth_asym_id', 'label_asym_id']),
+    ('res_id', ['auth_seq_id', 'label_seq_id']),
+    ('ins_code', ['pdbx_PDB_ins_code']),
+    ('x', ['Cartn_x']),
+    ('y', ['Cartn_y']),
+    ('z', ['Cartn_z']),
+    ('b_factor', ['B_iso_or_equiv']),
+    ('element', ['type_symbol']),
+    ('model', ['pdbx_PDB_model_num'])
+]
+MISSING_VALUES = [b'.', b'?']
+COMPOUND_CATEGORIES = ('_entity', '_entity_poly')
+RESERVED_WORDS = (b'loop_', b'data_', b'save_', b'global_')
+QUOTES = (ord("'"), ord('"'))
+# quoted strings end with quote followed by white space
+_TOKEN = re.compile(br"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""")
+
+
+def _tokens(line):
+    """Splits line to values, without quotes"""
+    if b"'" not in line and b'"' not in line:
+        return line.split()
+    return [match.group(match.lastindex) for match in _TOKEN.finditer(line)]
+
+
+def _splitColumns(text, n_columns, columns):
+    """Splits white space separated values of rows to columns (values in quotes without white spaces)
+    :param text: rows (bytes)
+    :param n_columns: number of values in each row
+    :param columns: indices of the columns to return
+    :return: list of bytes arrays of the columns, or None if the text can't be split this way
+    """
+    chars = np.frombuffer(text, dtype=np.uint8)
+    blank = np.concatenate([[True], chars <= ord(' '), [True]])
+    edges = np.flatnonzero(blank[1:] != blank[:-1])
+    starts, ends = edges[0::2], edges[1::2]
+    if len(starts) % n_columns:
+        return None
+    if len(starts) == 0:
+        return [np.zeros(0, dtype='S1') for _ in columns]
+    first, last = chars[starts], chars[ends - 1]
+    quoted = np.isin(first, QUOTES)
+    if (quoted & ((last != first) | (ends - starts < 2))).any():
+        return None
+    starts, ends = starts + quoted, ends - quoted
+    width = max(int((ends - starts).max()), 1)
+    padded = np.concatenate([chars, np.zeros(width, dtype=np.uint8)])
+    starts, ends = starts.reshape(-1, n_columns), ends.reshape(-1, n_columns)
+    split = []
+    for j in columns:
+        column_width = max(int((ends[:, j] - starts[:, j]).max()), 1)
+        matrix = padded[starts[:, j, None] + np.arange(column_width)]
+        matrix[np.arange(column_width) >= (ends[:, j] - starts[:, j])[:, None]] = 0
+        split.append(matrix.view('S%d' % column_width).ravel())
+    return split
+
+
+class _AtomSiteRows(object):
+    """
+    Rows of the atom_site loop, split to the columns of the fields of ATOM_SITE_ITEMS in blocks
+    """
+
+    def __init__(self, items):
+        self.n_columns = len(items)
+        self.fields, self.columns = [], []
+        for field, alternatives in ATOM_SITE_ITEMS:
+            for item in alternatives:
+                if item in items:
+                    self.fields.append(field)
+                    self.columns.append(items.index(item))
+                    break
+        self.first_model = None
+        self.stopped = False
+        self.lines, self.blocks = [], []
+
+    def add(self, line):
+        """Adds line of rows (usually a single row)
+        :return: False if reached the second model
+        """
+        self.lines.append(line)
+        if len(self.lines) >= ROWS_PER_BLOCK:
+            self._flush()
+        return not self.stopped
+
+    def _flush(self, last=False):
+        if not self.lines:
+            return
+        block = _splitColumns(b' '.join(self.lines), self.n_columns, self.columns)
+        if block is None:
+            # quoted values with white spaces or rows over lines
+            values = [value for line in self.lines for value in _tokens(line)]
+            if len(values) % self.n_columns and not last:
+                return  # wait for the rest of the row
+            values = values[:len(values) - len(values) % self.n_columns]
+            table = np.array(values, dtype=bytes).reshape(-1, self.n_columns)
+            block = [table[:, j] for j in self.columns]
+        self.lines = []
+        if 'model' in self.fields:
+            models = block[self.fields.index('model')]
+            if self.first_model is None and len(models):
+                self.first_model = models[0]
+            other_models = np.flatnonzero(models != self.first_model)
+            if len(other_models):
+                logging.info('using model 1 (more models are ignored)')
+                self.stopped = True
+                block = [values[:other_models[0]] for values in block]
+        self.blocks.append(block)
+
+    def columns_by_field(self):
+        """Dictionary of the fields to arrays"""
+        self._flush(last=True)
+        if not self.blocks:
+            return dict()
+        return dict((field, np.concatenate([block[j] for block in self.blocks])) for j, field in
+                    enumerate(self.fields))
+
+
+def _decoded(values, transform=None):
+    """Decodes bytes array to strings, repeating values are decoded once
+    :param transform: function applied to each value after decoding
+    """
+    unique, inverse = np.unique(values, return_inverse=True)
+    unique = [value.decode('ascii', 'replace') for value in unique.tolist()]
+    if transform is not None:
+        unique = [transform(value) for value in unique]
+    return np.array(unique or [''], dtype=str)[inverse.ravel()]
+
+
+def _atomRecords(columns):
+    """Records (see pdbReader.parseRecords) of atom_site fields"""
+    n = len(columns['x']) if 'x' in columns else 0
+
+    def column(field, default):
+        return columns[field] if field in columns else np.full(n, default)
+
+    # same semantics as the PDB reader: first alternate location and residues without insertion code
+    keep = np.isin(column('alt_loc', b'.'), MISSING_VALUES + [b'A']) & np.isin(column('ins_code', b'?'),
+                                                                               MISSING_VALUES)
+    columns = dict((field, values[keep]) for field, values in columns.items())
+    n = keep.sum()
+    residues = _decoded(column('residue', b''))
+    kinds = np.where(column('group', b'ATOM') == b'ATOM', RECORD_ATOM,
+                     np.where(residues == 'HOH', RECORD_WATER, RECORD_HETATM))
+    b_factors = column('b_factor', b'0')
+    elements = column('element', b'')
+    return {
+        'kinds': kinds,
+        'atom_nums': _decoded(column('atom_num', b'')),
+        'symbols': _decoded(column('symbol', b'')),
+        'residues': residues,
+        'chains': _decoded(column('chain', b'')),
+        'res_ids': column('res_id', b'0').astype(int),
+        'coords': np.stack([column(axis, b'0').astype(float) for axis in 'xyz'], axis=1).reshape(-1, 3),
+        'b_factors': np.where(kinds == RECORD_WATER, 0,
+                              np.where(np.isin(b_factors, MISSING_VALUES), b'0', b_factors).astype(float)),
+        # as the atom type of PDB files (column 78)
+        'elements': _decoded(np.where(np.isin(elements, MISSING_VALUES), b'', elements), lambda value: value[-1:])
+    }
+
+
+def parseCifRecords(stream):
+    """Parses mmCIF file to records of PDBReader (see pdbReader.parseRecords).
+    Only the first model is read, compounds are the polymer entities, and reading stops at the end of atom_site
+    :param stream: binary stream of the mmCIF file
+    :return: records, compounds and chains of compounds (as parseRecords)
+    :raises ValueError: if a chain id (auth_asym_id) is longer than one character
+    """
+    tables = dict((category, dict()) for category in COMPOUND_CATEGORIES)
+    atom_site = None
+    loop_items, loop_values, in_loop_header = None, [], False
+    key = None
+
+    def end_loop():
+        # values of a loop of compounds category, by item
+        if loop_items and loop_items[0].split('.')[0] in tables:
+            for j, item in enumerate(loop_items):
+                category, name = item.split('.', 1)
+                tables[category][name] = loop_values[j::len(loop_items)]
+
+    lines = iter(stream)
+    for line in lines:
+        if line.startswith(b';'):
+            # multi line text field
+            text = [line[1:].rstrip(b'\r\n')]
+            for line in lines:
+                if line.startswith(b';'):
+                    break
+                text.append(line.rstrip(b'\r\n'))
+            text = b'\n'.join(text).strip()
+            if atom_site is not None:
+                atom_site.add(b'"' + text + b'"')
+                continue
+            tokens = [text]
+        elif atom_site is not None:
+            start = line.lstrip()[:7].lower()
+            if not start or start.startswith(b'#'):
+                continue
+            if start.startswith(b'_') or start.startswith(RESERVED_WORDS):
+                break  # end of atom_site
+            if not atom_site.add(line):
+                break
+            continue
+        elif line.startswith(b'#'):
+            continue
+        else:
+            tokens = _tokens(line)
+        for k, token in enumerate(tokens):
+            lower = token.lower()
+            if lower.startswith(RESERVED_WORDS) or (token.startswith(b'_') and not in_loop_header):
+                end_loop()
+                loop_items, loop_values, in_loop_header = None, [], False
+                if lower == b'loop_':
+                    loop_items, in_loop_header = [], True
+                elif token.startswith(b'_'):
+                    key = token.decode('ascii', 'replace')
+            elif token.startswith(b'_'):
+                loop_items.append(token.decode('ascii', 'replace'))
+            elif in_loop_header and loop_items and loop_items[0].startswith('_atom_site.'):
+                in_loop_header = False
+                atom_site = _AtomSiteRows([item.split('.', 1)[1] for item in loop_items])
+                atom_site.add(line if k == 0 else b' '.join(tokens[k:]))
+                break
+            elif loop_items is not None:
+                in_loop_header = False
+                loop_values.append(token.decode('ascii', 'replace'))
+            elif key is not None:
+                category, name = key.split('.', 1) if '.' in key else (key, '')
+                if category in tables:
+                    tables[category][name] = [token.decode('ascii', 'replace')]
+                key = None
+    end_loop()
+
+    records = _atomRecords(atom_site.columns_by_field() if atom_site is not None else dict())
+    descriptions = dict(zip(tables['_entity'].get('id', []), tables['_entity'].get('pdbx_description', [])))
+    cmpnds, cmpndChains = [], []
+    long_chains = set()
+    for entity, chains in zip(tables['_entity_poly'].get('entity_id', []),
+                              tables['_entity_poly'].get('pdbx_strand_id', [])):
+        cmpnds.append(descriptions.get(entity, '').replace(',', ' '))
+        cmpndChains.append(chains.replace(',', ''))
+        long_chains.update(chain for chain in chains.split(',') if len(chain) > 1)
+    long_chains.update(chain for chain in np.unique(records['chains']) if len(chain) > 1)
+    if long_chains:
+        # chains are single characters everywhere (strings of chains of interface parts and compounds)
+        raise ValueError('multi-character chain ids are not supported: %s' % ', '.join(sorted(long_chains)))
+    return records, cmpnds, cmpndChains
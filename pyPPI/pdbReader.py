@@ -5,15 +5,36 @@ References:
 *http://www.wwpdb.org/documentation/format33/sect9.html#ATOM -pdb RFC
 """
 
+import bz2
+import gzip
+import io
 import logging
 import math
+import mmap
 import os
+from contextlib import closing
+from itertools import combinations
 
-from .atom import atom, water
+import numpy as np
+
+from .atom import atom, water, coordsBuffer
+from .atomAnnotations import AtomAnnotations
+from .atomArrays import AtomArrays
+from .donorAcceptor import ResidueTopology
 from .kdtree import KDTree
+from .structureCache import StructureCache, DEFAULT_MAX_BYTES
 
 NEIGHBOR_DISTANCE = 16
 PDBS_DIR = None
+# directory of cached parsed structures (see structureCache). None for no cache
+CACHE_DIR = None
+CACHE_MAX_BYTES = DEFAULT_MAX_BYTES
+# kinds of records (of parseRecords)
+RECORD_ATOM, RECORD_WATER, RECORD_HETATM = 0, 1, 2
+# readers of compressed files (by extension), decompressing incrementally
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open}
+CIF_EXTENSIONS = ('.cif', '.mmcif')
+STREAM_CHUNK_SIZE = 4 * 1024 ** 2  # bytes of decompressed text parsed at once
 
 def angle(DH, distance, HA, radians=True):
     ang = math.acos((DH ** 2 - distance ** 2 + HA ** 2) / (2 * DH * HA))
@@ -22,6 +43,11 @@ def angle(DH, distance, HA, radians=True):
     return ang
 
 
+def cosAngle(DH, distance, HA):
+    """Cosine of the angle (see angle) of arrays of triangles side lengths, clipped to [-1, 1]"""
+    return np.clip((DH ** 2 - distance ** 2 + HA ** 2) / (2 * DH * HA), -1, 1)
+
+
 def radianToAngle(radian):
     """Get angle from radian
     :param radian: Radian
@@ -30,24 +56,196 @@ def radianToAngle(radian):
     return radian * (180 / math.pi)
 
 
+def parseRecords(data):
+    """Vectorized parser of PDB text
+
+    Lines are located with numpy, and the fixed width columns of all the ATOM/HETATM records are decoded at once.
+    Same semantics as PDBReader.readFile: only the first alternate location (blank or A) and residues without
+    insertion code are kept, and reading stops at END line or at the second model.
+
+    :param data: PDB file content (bytes, or memory mapped file)
+    :return: dictionary of arrays for the records (kinds - RECORD_ATOM/RECORD_WATER/RECORD_HETATM, atom_nums,
+             symbols, residues, chains, res_ids, coords, b_factors, elements), compounds and chains of compounds
+    """
+    return _parseLines(data)[:3]
+
+
+def parseRecordsStream(stream, chunk_size=STREAM_CHUNK_SIZE):
+    """Parses PDB text from stream (such as decompressing file) in chunks of lines, see parseRecords
+    :param stream: binary stream of PDB text
+    :param chunk_size: bytes read from the stream at once
+    :return: records, compounds and chains of compounds (as parseRecords)
+    """
+    parsed, remainder = [], b''
+    while True:
+        data = stream.read(chunk_size)
+        text = remainder + data
+        if data:
+            # parse complete lines, the last partial line is parsed with the next chunk
+            cut = text.rfind(b'\n') + 1
+            text, remainder = text[:cut], text[cut:]
+        if text:
+            records, cmpnds, cmpndChains, stopped = _parseLines(text)
+            parsed.append((records, cmpnds, cmpndChains))
+            if stopped:
+                break
+        if not data:
+            break
+    if not parsed:
+        return parseRecords(b'')
+    records = dict((field, np.concatenate([chunk[0][field] for chunk in parsed])) for field in parsed[0][0])
+    return records, sum([chunk[1] for chunk in parsed], []), sum([chunk[2] for chunk in parsed], [])
+
+
+def fileFormat(path):
+    """Format of structure file by its extension
+    :param path: path (or name) of the file
+    :return: opener of the compression (see COMPRESSED_OPENERS, None for uncompressed) and extension of the text
+    """
+    base, extension = os.path.splitext(path.lower())
+    opener = COMPRESSED_OPENERS.get(extension)
+    if opener is not None:
+        extension = os.path.splitext(base)[1]
+    return opener, extension
+
+
+def readRecords(path, chunk_size=STREAM_CHUNK_SIZE):
+    """Parses structure file: PDB or mmCIF (by extension), optionally compressed with gzip or bz2 (.gz/.bz2).
+    Plain PDB files are memory mapped, and compressed files are decompressed incrementally
+    :param path: path of the file
+    :param chunk_size: bytes of compressed PDB text parsed at once
+    :return: records, compounds and chains of compounds (as parseRecords)
+    """
+    opener, extension = fileFormat(path)
+    if opener is not None or extension in CIF_EXTENSIONS:
+        with open(path, 'rb') as stream:
+            return parseFileData(stream, path, chunk_size)
+    with open(path, 'rb') as pdbFile:
+        if os.fstat(pdbFile.fileno()).st_size == 0:
+            return parseRecords(b'')
+        with closing(mmap.mmap(pdbFile.fileno(), 0, access=mmap.ACCESS_READ)) as data:
+            return parseRecords(data)
+
+
+def parseFileData(data, path, chunk_size=STREAM_CHUNK_SIZE):
+    """Parses content of structure file, with the format of the file path (see readRecords)
+    :param data: content of the file: bytes or binary stream
+    :param path: path (or name) of the file
+    :param chunk_size: bytes of compressed PDB text parsed at once
+    :return: records, compounds and chains of compounds (as parseRecords)
+    """
+    opener, extension = fileFormat(path)
+    stream = io.BytesIO(data) if isinstance(data, bytes) else data
+    if opener is not None:
+        stream = opener(stream, 'rb')
+    with stream:
+        if extension in CIF_EXTENSIONS:
+            from .mmcifReader import parseCifRecords
+            return parseCifRecords(stream)
+        if opener is not None:
+            return parseRecordsStream(stream, chunk_size)
+        return parseRecords(data if isinstance(data, bytes) else stream.read())
+
+
+def _parseLines(data):
+    """parseRecords, and whether an END line or second model was reached"""
+    text = np.frombuffer(data, dtype=np.uint8) if len(data) else np.zeros(0, dtype=np.uint8)
+    newlines = np.flatnonzero(text == ord('\n'))
+    starts = np.concatenate([[0], newlines + 1])
+    ends = np.concatenate([newlines, [len(text)]])
+    if len(starts) > 1 and starts[-1] == len(text):
+        starts, ends = starts[:-1], ends[:-1]
+    # universal newlines (as in text mode): \r\n ends a line as \n
+    carriage = (ends > starts) & (text[np.maximum(ends - 1, 0)] == ord('\r'))
+    ends = ends - carriage
+    lengths = ends - starts
+
+    def line_prefix(prefix):
+        matches = lengths >= len(prefix)
+        for i, char in enumerate(bytearray(prefix)):
+            matches &= text[np.minimum(starts + i, len(text) - 1)] == char
+        return matches
+
+    # stop at END line or at the second model
+    stop = np.flatnonzero((line_prefix(b'END') & (lengths == 3)) | line_prefix(b'MODEL        2'))
+    stopped = len(stop) > 0
+    if stopped:
+        if not (line_prefix(b'END') & (lengths == 3))[stop[0]]:
+            logging.info('using model 1 (more models are ignored)')
+        starts, ends, lengths = starts[:stop[0]], ends[:stop[0]], lengths[:stop[0]]
+
+    cmpnds, cmpndChains = [], []
+    for i in np.flatnonzero(line_prefix(b'COMPND')):
+        line = bytes(data[starts[i]:ends[i]]).decode('ascii', 'replace') + '\n'
+        if 'MOLECULE:' in line:
+            cmpnds.append(line.split('MOLECULE:')[1].strip('; \n').replace(',', ' '))
+        elif 'CHAIN:' in line:
+            cmpndChains.append(line.split('CHAIN: ')[1].strip('; \n').replace(', ', ''))
+
+    is_atom = line_prefix(b'ATOM  ')
+    selected = np.flatnonzero(is_atom | line_prefix(b'HETATM'))
+    # (records, 80) matrix of the columns, zero after the end of the line
+    padded = np.concatenate([text, np.zeros(80, dtype=np.uint8)])
+    columns_matrix = padded[starts[selected, None] + np.arange(80)]
+    columns_matrix[np.arange(80) >= lengths[selected, None]] = 0
+
+    def field(start, end):
+        return np.ascontiguousarray(columns_matrix[:, start:end]).view('S%d' % (end - start)).ravel()
+
+    def text_field(start, end):
+        # repeating values (residues, atom symbols) are decoded once
+        unique, inverse = np.unique(field(start, end), return_inverse=True)
+        return np.char.strip(unique).astype(str)[inverse.ravel()]
+
+    def raw_field(start, end):
+        # single character columns kept as is (blank chain is ' ', as line[21:22] of readFile)
+        unique, inverse = np.unique(field(start, end), return_inverse=True)
+        return unique.astype(str)[inverse.ravel()]
+
+    keep = ((field(16, 17) == b' ') | (field(16, 17) == b'A')) & (field(26, 27) == b' ')
+    columns_matrix = columns_matrix[keep]
+    residues = text_field(17, 20)
+    kinds = np.where(is_atom[selected][keep], RECORD_ATOM, np.where(residues == 'HOH', RECORD_WATER, RECORD_HETATM))
+    unique_res_ids, res_ids = np.unique(field(22, 26), return_inverse=True)
+    records = {
+        'kinds': kinds,
+        'atom_nums': np.char.strip(field(6, 11)).astype(str),
+        'symbols': text_field(12, 16),
+        'residues': residues,
+        'chains': raw_field(21, 22),
+        'res_ids': unique_res_ids.astype(int)[res_ids.ravel()],
+        'coords': np.stack([field(30, 38).astype(float), field(38, 46).astype(float), field(46, 54).astype(float)],
+                           axis=1).reshape(-1, 3),
+        'b_factors': np.where(kinds == RECORD_WATER, 0, field(60, 66).astype(float)),
+        'elements': raw_field(77, 78)
+    }
+    return records, cmpnds, cmpndChains, stopped
+
+
 class PDBReader(object):
     """ class that handles PDB files and utilities """
 
     @staticmethod
-    def readFile(path, interface_parts=None):
-        """Reads PDB file
+    def readFile(path, interface_parts=None, fast=False):
+        """Reads PDB file. mmCIF files and compressed files (.gz/.bz2) are read by readFileFast
         :param path:  path of the file
         :param interface_parts: relevant chains
+        :param fast: use the vectorized parser of memory mapped file (see readFileFast)
         :return: a PDB object
         """
+        if CACHE_DIR is not None:
+            return PDBReader.readFileCached(path, interface_parts)
+        extension = os.path.splitext(path.lower())[1]
+        if fast or extension in COMPRESSED_OPENERS or extension in CIF_EXTENSIONS:
+            return PDBReader.readFileFast(path, interface_parts)
         name = os.path.basename(path)[0:4]
         pdbFile = open(path, 'r')
-        atoms = []
-        waters = []
+        records = []  # (kind, atom attributes without coordinate)
+        coords = []
+        strings = dict()  # shared instances of repeating names (residues, atom symbols)
 
         cmpnds = []
         cmpndChains = []
-        hetAtms = []
         logging.info('reading pdb file (atoms and HETATM of HOH) %s', path)
         # read file for chain atoms and water
         for line in pdbFile.readlines():
@@ -63,17 +261,15 @@ class PDBReader(object):
                 # skip on multimodel. see 1EAW Res 60 chain A
                 if line[26:27] != ' ':
                     continue
-                coord = (float(x), float(y), float(z))
+                coords.append((float(x), float(y), float(z)))
                 if line[0:6] == 'ATOM  ':
-
-                    atoms.append(
-                        atom(atomNum, atomSymbol, residue, chain, resId, atomType, coord, beta_factor=tempFactor))
-                elif line[0:6] == 'HETATM':
-                    if residue == 'HOH':
-                        waters.append(water(atomNum, atomSymbol, residue, chain, resId, atomType, coord))
-                    else:
-                        hetAtms.append(
-                            atom(atomNum, atomSymbol, residue, chain, resId, atomType, coord, beta_factor=tempFactor))
+                    kind = 'atom'
+                elif residue == 'HOH':
+                    kind = 'water'
+                else:
+                    kind = 'hetatm'
+                records.append((kind, atomNum, strings.setdefault(atomSymbol, atomSymbol),
+                                strings.setdefault(residue, residue), chain, resId, atomType, tempFactor))
             elif line[0:6] == "COMPND" and 'MOLECULE:' in line:
                 cmpnds.append(line.split('MOLECULE:')[1].strip('; \n').replace(',', ' '))
             elif line[0:6] == "COMPND" and 'CHAIN:' in line:
@@ -85,12 +281,99 @@ class PDBReader(object):
             elif line[0:14] == "MODEL        2":
                 logging.info('using model 1 (more models are ignored)')
                 break
+        # atoms coordinates are rows of a single array
+        atoms, waters, hetAtms = [], [], []
+        coords_array, coords_buffer = coordsBuffer(coords)
+        for row, (kind, atomNum, atomSymbol, residue, chain, resId, atomType, tempFactor) in enumerate(records):
+            if kind == 'atom':
+                atoms.append(atom(atomNum, atomSymbol, residue, chain, resId, atomType, row, beta_factor=tempFactor,
+                                  coords_buffer=coords_buffer))
+            elif kind == 'water':
+                waters.append(water(atomNum, atomSymbol, residue, chain, resId, atomType, row,
+                                    coords_buffer=coords_buffer))
+            else:
+                hetAtms.append(atom(atomNum, atomSymbol, residue, chain, resId, atomType, row, beta_factor=tempFactor,
+                                    coords_buffer=coords_buffer))
         logging.info('finished reading file. waters:' + str(len(waters)) + ' atoms: ' + str(len(atoms)))
         if interface_parts is None:
             interface_parts = cmpndChains
         return PDBReader(name, atoms, waters, cmpnds, hetAtms, interface_parts=interface_parts)
 
-    def __init__(self, name, atoms, waters, compunds, hetAtms, interface_parts=['A', 'B']):
+    @staticmethod
+    def readFileFast(path, interface_parts=None):
+        """Reads PDB file: the file is memory mapped and the fixed width columns of all the ATOM/HETATM records
+        are decoded at once (see parseRecords). Same atoms and semantics as readFile.
+        mmCIF files and compressed files are supported too (see readRecords)
+        :param path:  path of the file
+        :param interface_parts: relevant chains
+        :return: a PDB object
+        """
+        logging.info('reading pdb file (atoms and HETATM of HOH) %s', path)
+        records, cmpnds, cmpndChains = readRecords(path)
+        return PDBReader.fromRecords(os.path.basename(path)[0:4], records, cmpnds, cmpndChains, interface_parts)
+
+    @staticmethod
+    def readFileCached(path, interface_parts=None, cache_dir=None, max_bytes=None):
+        """Reads PDB file through cache of parsed structures, keyed by the file content.
+        Structures not in the cache are parsed (see readRecords) and added to the cache
+        :param path:  path of the file
+        :param interface_parts: relevant chains
+        :param cache_dir: directory of the cache (default CACHE_DIR)
+        :param max_bytes: size cap of the cache (default CACHE_MAX_BYTES)
+        :return: a PDB object
+        """
+        if cache_dir is None:
+            cache_dir = CACHE_DIR
+        if max_bytes is None:
+            max_bytes = CACHE_MAX_BYTES
+        cache = StructureCache(cache_dir, max_bytes)
+        with open(path, 'rb') as pdbFile:
+            data = pdbFile.read()
+        key = StructureCache.key(data)
+        parsed = cache.load(key)
+        if parsed is None:
+            logging.info('reading pdb file (atoms and HETATM of HOH) %s', path)
+            parsed = parseFileData(data, path)
+            cache.save(key, *parsed)
+        records, cmpnds, cmpndChains = parsed
+        return PDBReader.fromRecords(os.path.basename(path)[0:4], records, cmpnds, cmpndChains, interface_parts)
+
+    @staticmethod
+    def fromRecords(name, records, cmpnds, cmpndChains, interface_parts=None):
+        """Creates PDB object from parsed records
+        :param name: name of the PDB
+        :param records: dictionary of arrays (see parseRecords)
+        :param cmpnds: compounds (molecules) names
+        :param cmpndChains: chains of each compound
+        :param interface_parts: relevant chains (default: chains of the compounds)
+        :return: a PDB object
+        """
+        atoms, waters, hetAtms = [], [], []
+        coords_array, coords_buffer = coordsBuffer(records['coords'])
+        # repeating names (residues, atom symbols) share instances
+        columns = [records['kinds'].tolist(), records['atom_nums'].tolist()]
+        for field in ['symbols', 'residues', 'chains', 'elements']:
+            unique, inverse = np.unique(records[field], return_inverse=True)
+            unique = unique.tolist()
+            columns.append([unique[i] for i in inverse.ravel().tolist()])
+        columns += [records['res_ids'].tolist(), records['b_factors'].tolist()]
+        for row, (kind, atomNum, atomSymbol, residue, chain, atomType, resId, tempFactor) in enumerate(zip(*columns)):
+            if kind == RECORD_ATOM:
+                atoms.append(atom(atomNum, atomSymbol, residue, chain, resId, atomType, row, beta_factor=tempFactor,
+                                  coords_buffer=coords_buffer))
+            elif kind == RECORD_WATER:
+                waters.append(water(atomNum, atomSymbol, residue, chain, resId, atomType, row,
+                                    coords_buffer=coords_buffer))
+            else:
+                hetAtms.append(atom(atomNum, atomSymbol, residue, chain, resId, atomType, row, beta_factor=tempFactor,
+                                    coords_buffer=coords_buffer))
+        logging.info('finished reading file. waters:' + str(len(waters)) + ' atoms: ' + str(len(atoms)))
+        if interface_parts is None:
+            interface_parts = cmpndChains
+        return PDBReader(name, atoms, waters, cmpnds, hetAtms, interface_parts=interface_parts,
+                         atoms_coords=coords_array[records['kinds'] == RECORD_ATOM])
+
+    def __init__(self, name, atoms, waters, compunds, hetAtms, interface_parts=['A', 'B'], atoms_coords=None):
         self.compunds = ' - '.join(compunds)
         self.interfaceParts = interface_parts
         self.name = name
@@ -100,23 +383,72 @@ class PDBReader(object):
         self.chains = set([a.chain for a in atoms])
         self.interfaceCache = None
         self.cacheDistance = 0
+        self.interfacePairsCache = dict()
+        self.arraysCache = None
+        self.annotationsCache = None
+        self.atomsIndexCache = None
+        self.topologyCache = None
+        self.atomsCoords = atoms_coords
+        self.ktreeCache = None
+        self.treesCache = dict()
+        self.waterTreeCache = None
         self.__buildIndex()
 
     def __buildIndex(self):
-        """ Init the internal indexs for the atoms and their pseudoChain, and k-tree """
-        logging.debug('building k-tree')
-        self.ktree = KDTree.construct_from_data(self.atoms[:])
-        logging.debug('end building k-tree')
+        """ Init the internal indexs for the atoms and their pseudoChain (the k-tree is built on first use) """
         logging.debug('building indexs')
+        # assign pseudo chain to residue which symbols the interface chains (example: A:B)
+        pseudo_chains = dict()
+        for j, interPart in enumerate(self.interfaceParts):
+            partChains = set(interPart) - {''}
+            for chain in [chain for chain in self.chains if chain in partChains]:
+                pseudo_chains[chain] = chr(ord('A') + j)
         for i, a in enumerate(self.atoms):
             a.atomIndex = i
-            # assign pseudo chain to residue which symbols the interface chains (example: A:B)
-            for j, interPart in enumerate(self.interfaceParts):
-                if a.chain in interPart:
-                    a.pseudoChain = chr(ord('A') + j)
+            if a.chain in pseudo_chains:
+                a.pseudoChain = pseudo_chains[a.chain]
 
         logging.debug('end building index')
 
+    @property
+    def ktree(self):
+        """KD-tree of all the atoms, built on first use"""
+        if self.ktreeCache is None:
+            logging.debug('building k-tree')
+            self.ktreeCache = KDTree.construct_from_data(self.atoms[:], self.atomsCoords)
+            logging.debug('end building k-tree')
+        return self.ktreeCache
+
+    def getTree(self, chains=None, pseudo_chain=None, annotation=None, pH=7):
+        """Get KD-tree of subset of the atoms. Trees are memoized by the subset, so each tree is built once
+
+        :param chains: chains of the atoms (string or list of chains), None for all the chains
+        :param pseudo_chain: pseudo chain of the atoms (such as 'A'), None for all the atoms
+        :param annotation: name of annotation of the atoms (see AtomAnnotations.mask), such as 'charged'.
+                           None for all the atoms
+        :param pH: pH of the 'charged' annotation
+        :return: KDTree of the atoms of the subset (in the order of the atoms)
+        """
+        key = (None if chains is None else frozenset(chains), pseudo_chain, annotation,
+               pH if annotation == 'charged' else None)
+        if key == (None, None, None, None):
+            return self.ktree
+        if key not in self.treesCache:
+            mask = None if annotation is None else self.getAnnotations().mask(annotation, pH)
+            subset = [a for a in self.atoms if (chains is None or a.chain in key[0]) and
+                      (pseudo_chain is None or a.pseudoChain == pseudo_chain) and (mask is None or mask[a.atomIndex])]
+            coords = None
+            if self.atomsCoords is not None:
+                coords = self.atomsCoords[[a.atomIndex for a in subset]].reshape(-1, 3)
+            self.treesCache[key] = KDTree.construct_from_data(subset, coords)
+        return self.treesCache[key]
+
+    def getWaterTree(self):
+        """Get KD-tree of the waters (in the order of waters), built on first use"""
+        if self.waterTreeCache is None:
+            self.waterTreeCache = KDTree.construct_from_data(self.waters)
+        return self.waterTreeCache
+
     def getFile(self, name):
         if PDBS_DIR is None:
             path = "./debug/"
@@ -131,8 +463,28 @@ class PDBReader(object):
         for j, interPart in enumerate(self.interfaceParts):
             yield chr(ord('A') + j)
 
+    def getInterfacePairs(self, max_distance=NEIGHBOR_DISTANCE):
+        """Get pairs of atoms from different pseudo chains, having distance less than maxDistance
+
+        :param max_distance: squared distance between the atoms of the pairs
+        :return: dictionary from pair of interacting pseudo chains (such as ('A', 'B')) to pair of arrays
+                 of the indices (atomIndex) of the atoms of the pairs in the first and in the second pseudo chain
+        """
+        if max_distance not in self.interfacePairsCache:
+            pseudo_chains = list(self.getPseudoChains())
+            trees = [self.getTree(pseudo_chain=pseudo_chain) for pseudo_chain in pseudo_chains]
+            indices = [np.array([a.atomIndex for a in tree.atoms], dtype=int) for tree in trees]
+            pairs = dict()
+            for j, k in combinations(range(len(pseudo_chains)), 2):
+                first, second = trees[j].findPairsByDistance(trees[k], max_distance)
+                if len(first):
+                    pairs[(pseudo_chains[j], pseudo_chains[k])] = (indices[j][first], indices[k][second])
+            self.interfacePairsCache[max_distance] = pairs
+        return self.interfacePairsCache[max_distance]
+
     def getInterface(self, max_distance=NEIGHBOR_DISTANCE):
-        """Get atoms not from same chain, having distance less than maxDistance ignores H
+        """Get atoms of pseudo chain A and atoms of other pseudo chains, having distance less than maxDistance
+        (see getInterfacePairs for all the pseudo chains)
         """
         if self.interfaceCache is not None and self.cacheDistance == max_distance:
             return self.interfaceCache
@@ -140,19 +492,79 @@ class PDBReader(object):
         self.cacheDistance = max_distance
         self.interfaceCache = set()
         interfacesT = self.interfaceCache
-        # we assume dimers
-
-        for atom in (atom for atom in self.atoms if atom.pseudoChain == 'A'):
-            for atom2 in self.ktree.findByDistance(query_point=atom.coord, distance=max_distance):
-                if atom2.pseudoChain == atom.pseudoChain or atom2.pseudoChain is None:
-                    continue
-                interfacesT.add(atom)
-                interfacesT.add(atom2)
+        for (pseudo_chain, _), (first, second) in self.getInterfacePairs(max_distance).items():
+            if pseudo_chain == 'A':
+                interfacesT.update(self.atoms[i] for i in np.concatenate([first, second]).tolist())
 
         # extend with H
         print('interface atoms:', len(interfacesT))
         return self.interfaceCache
 
+    def getAtomIndices(self, chain, resId, symbol=None, prefix=False):
+        """Get indices (atomIndex) of atoms by chain, residue and atom name, using hash index of the atoms
+
+        :param chain: chain of the atoms
+        :param resId: residue id of the atoms
+        :param symbol: name of the atoms (symbol), None for all the atoms of the residue
+        :param prefix: match symbol to the first 3 characters of the atom names (symbol[0:3]), as in database tables
+        :return: list of indices of the matching atoms (in the order of the atoms)
+        """
+        if self.atomsIndexCache is None:
+            residues, symbols, prefixes = dict(), dict(), dict()
+            for a in self.atoms:
+                residues.setdefault((a.chain, a.resId), []).append(a.atomIndex)
+                symbols.setdefault((a.chain, a.resId, a.symbol), []).append(a.atomIndex)
+                prefixes.setdefault((a.chain, a.resId, a.symbol[0:3]), []).append(a.atomIndex)
+            self.atomsIndexCache = residues, symbols, prefixes
+        residues, symbols, prefixes = self.atomsIndexCache
+        if symbol is None:
+            return residues.get((chain, resId), [])
+        return (prefixes if prefix else symbols).get((chain, resId, symbol), [])
+
+    def resolveAtoms(self, rows, prefix=False, first=False):
+        """Resolves rows of (chain, resId, symbol) to atoms, such as result set of database query
+
+        :param rows: iterable of (chain, resId, symbol)
+        :param prefix: match symbol to the first 3 characters of the atom names (see getAtomIndices)
+        :param first: only the first matching atom of each row (default all the matching atoms)
+        :return: array of indices (atomIndex) of the atoms of the rows, in the order of the rows.
+                 rows without matching atoms are skipped (with warning)
+        """
+        indices = []
+        unresolved = 0
+        for chain, resId, symbol in rows:
+            matches = self.getAtomIndices(chain, resId, symbol, prefix)
+            if len(matches) == 0:
+                unresolved += 1
+            indices.extend(matches[:1] if first else matches)
+        if unresolved:
+            logging.warning('%s: %i rows without matching atoms are skipped', self.name, unresolved)
+        return np.array(indices, dtype=int)
+
+    def getArrays(self):
+        """Get columnar representation of the atoms (indexed by atomIndex, as ktree)
+        :return: AtomArrays of the atoms
+        """
+        if self.arraysCache is None:
+            self.arraysCache = AtomArrays(self.atoms, self.interfaceParts)
+        return self.arraysCache
+
+    def getAnnotations(self):
+        """Get annotations of the atoms: C-terminal flags, charges (by pH) and residue classes
+        :return: AtomAnnotations of the atoms
+        """
+        if self.annotationsCache is None:
+            self.annotationsCache = AtomAnnotations(self.getArrays())
+        return self.annotationsCache
+
+    def getTopology(self):
+        """Get residue topology of the atoms: residue spans and hydrogens/antecedents of donors/acceptors
+        :return: ResidueTopology of the atoms
+        """
+        if self.topologyCache is None:
+            self.topologyCache = ResidueTopology(self.atoms)
+        return self.topologyCache
+
     def atoms(self):
         """Get atoms in the PDB"""
         return self.atoms
@@ -0,0 +1,117 @@
+"""
+On disk cache of parsed structures
+
+The records of a parsed PDB file (see pdbReader.parseRecords) are stored as uncompressed npz files,
+keyed by the hash of the file content. The cache has a size cap,
+and the least recently used structures are evicted (usage is tracked by the modification time of the files).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+CACHE_EXTENSION = '.npz'
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2GB
+RECORD_FIELDS = {  # field: dtype in cache
+    'kinds': np.int8,
+    'atom_nums': str,
+    'symbols': str,
+    'residues': str,
+    'chains': str,
+    'res_ids': np.int32,
+    'coords': float,
+    'b_factors': float,
+    'elements': str
+}
+
+
+class StructureCache(object):
+    """
+    Directory of cached parsed structures with size cap
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: directory of the cache (created if doesn't exist)
+        :param max_bytes: maximal size of the cached files
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(data):
+        """Key of structure in the cache
+        :param data: content of the PDB file (bytes)
+        :return: hex digest of the content
+        """
+        return hashlib.sha1(data).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + CACHE_EXTENSION)
+
+    def load(self, key):
+        """Loads cached structure
+        :param key: key of the structure (see key)
+        :return: tuple of records, compounds and chains of compounds (as parseRecords), or None if not cached
+        """
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as cached:
+                records = dict((field, cached[field]) for field in RECORD_FIELDS)
+                cmpnds, cmpndChains = cached['cmpnds'].tolist(), cached['cmpndChains'].tolist()
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        try:
+            os.utime(path, None)  # recently used
+        except OSError:
+            pass
+        logging.debug('structure loaded from cache %s', path)
+        return records, cmpnds, cmpndChains
+
+    def save(self, key, records, cmpnds, cmpndChains):
+        """Stores parsed structure in the cache, and evicts least recently used structures above the size cap
+        :param key: key of the structure (see key)
+        :param records: dictionary of arrays (see parseRecords)
+        :param cmpnds: compounds (molecules) names
+        :param cmpndChains: chains of each compound
+        """
+        arrays = dict((field, np.asarray(records[field]).astype(dtype)) for field, dtype in RECORD_FIELDS.items())
+        arrays['cmpnds'] = np.array(cmpnds, dtype=str)
+        arrays['cmpndChains'] = np.array(cmpndChains, dtype=str)
+        # write to temporary file and rename, so readers never see partial files
+        handle, temp_path = tempfile.mkstemp(suffix=CACHE_EXTENSION, dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                np.savez(temp_file, **arrays)
+            os.replace(temp_path, self.path(key))
+        except (IOError, OSError):
+            logging.warning('failed to write structure to cache %s', self.directory)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used structures until the cache is within the size cap"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_EXTENSION):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+            except OSError:
+                pass
@@ -8,13 +8,32 @@ Calculates VDW:
 import math
 import sys
 
+import numpy as np
+
 sys.path.append('../')
 from ..pdbReader import PDBReader
-from ..ASA import radio_atom, spiral, KNOWN_RADIUS
-from ..kdtree import KDTree
+from ..ASA import radio_atom, spiral, sphere_points, KNOWN_RADIUS, SPIRAL_POINTS
 from .. import DBConfig
 
 MAX_WW_RAD = max(KNOWN_RADIUS.values())
+VDW_CUTOFF = 9  # distance of atoms pairs
+#see p3 from DRIEDING: A generic force field for molecule simulations
+DREIDING_R0 = {
+    'H': 3.195,
+    'C': 3.8983,
+    'N': 3.6621,
+    'O': 3.4046,
+    'S': 4.03
+}
+DREIDING_D0 = {
+    'H': 0.0152,
+    'C': 0.0951,
+    'N': 0.0774,
+    'O': 0.0957,
+    'S': 0.3440
+}
+HBOND_H_D0 = 0.0001  # well depth of hydrogens of hydrogen bonds
+X6_M0 = 13.772
 
 
 def getHbondsH(pdb):
@@ -26,10 +45,7 @@ def getHbondsH(pdb):
                         inner join donors2
                         on DonorSymbol=donors2.Symbol
                         where PDB='%s'""" % pdb.name)
-    interfaceAtoms = []
-    for chain, resId, symbol in cursor.fetchall():
-        interfaceAtoms += [a for a in pdb.atoms if a.chain == chain and a.resId == resId and a.symbol == symbol]
-    return interfaceAtoms
+    return [pdb.atoms[i] for i in pdb.resolveAtoms(cursor.fetchall())]
 
 
 def get_interface_atoms(pdb):
@@ -41,10 +57,7 @@ def get_interface_atoms(pdb):
                         NinterfaceAtoms
                         where PDB='%s'""" % ( pdb.name ))
 
-    interfaceAtoms = []
-    for chain, resId, symbol in cursor.fetchall():
-        interfaceAtoms += [a for a in pdb.atoms if a.chain == chain and a.resId == resId and a.symbol[0:3] == symbol]
-    return interfaceAtoms
+    return [pdb.atoms[i] for i in pdb.resolveAtoms(cursor.fetchall(), prefix=True)]
 
 
 def getNamesAndChainFromDB():
@@ -75,13 +88,14 @@ def calcFunc(atomA, atomBs, func, estimate):
         volume2 = func(baseIntB)
         return volume1 + volume2
     else:#estimate
-        ballPoints = list(spiral(radio_atom(atomA.atomType), atomA))
-        clashs = []
+        ballPoints = list(spiral(atomRadA, atomA))
+        clashs = set()
 
         for b in atomBs:
+            atomRadB2 = radio_atom(b.atomType) ** 2
             for p in ballPoints:
-                if p not in clashs and b.distanceFromXYZ(p) < radio_atom(b.atomType) ** 2:
-                    clashs.append(p)
+                if p not in clashs and b.distanceFromXYZ(p) < atomRadB2:
+                    clashs.add(p)
         volume = estimate(atomRadA)
         volume = volume * float(len(clashs) / len(ballPoints))
         return volume
@@ -96,33 +110,61 @@ def calcClash(atomA, atomBs, surface):
     return calcFunc(atomA, atomBs, func, estimateFunc)
 
 
+def calcClashes(centers, radii, owners, partners, partnerRadii, dist, n_points=SPIRAL_POINTS):
+    """
+    Batched calcClash for many atoms: clash volume and surface of each atom with its colliding atoms.
+    Atoms colliding with single atom get the exact two sphere caps, and atoms colliding with several atoms
+    are estimated by the fraction of the points of sphere template occluded by any of them
+    :param centers: coordinates of the atoms
+    :param radii: radii of the atoms
+    :param owners: index (in centers) of the atom of each collision (sorted)
+    :param partners: coordinates of the colliding atoms
+    :param partnerRadii: radii of the colliding atoms
+    :param dist: distances of the collisions
+    :param n_points: number of points of the sphere template
+    :return: arrays of clash volume and of clash surface of the atoms
+    """
+    volumes, surfaces = np.zeros(len(centers)), np.zeros(len(centers))
+    counts = np.bincount(owners, minlength=len(centers))
+
+    # exact: two sphere caps of single collision
+    single = counts[owners] == 1
+    atoms = owners[single]
+    atomRadA, atomRadB = radii[atoms], partnerRadii[single]
+    collosionRad2 = ((atomRadB + atomRadA - dist[single]) / 2) ** 2
+    baseIntA = np.sqrt(np.maximum(atomRadA ** 2 - collosionRad2, 0))
+    baseIntB = np.sqrt(np.maximum(atomRadB ** 2 - collosionRad2, 0))
+    surfaces[atoms] = math.pi * baseIntA ** 2 + math.pi * baseIntB ** 2
+    volumes[atoms] = math.pi * (baseIntA ** 3) / 3.0 + math.pi * (baseIntB ** 3) / 3.0
+
+    # estimate: sphere points of the atom occluded by any of the colliding atoms
+    multi = np.flatnonzero(counts[owners] > 1)
+    if len(multi):
+        atoms, starts = np.unique(owners[multi], return_index=True)
+        points = sphere_points(n_points)[None, :, :] * radii[owners[multi], None, None] + \
+                 centers[owners[multi], None, :]
+        diff = partners[multi, None, :] - points
+        inside = diff[..., 0] ** 2 + diff[..., 1] ** 2 + diff[..., 2] ** 2 < partnerRadii[multi, None] ** 2
+        fraction = np.logical_or.reduceat(inside, starts, axis=0).sum(axis=1) / float(n_points)
+        atomRadA = radii[atoms]
+        surfaces[atoms] = 4.0 * math.pi * atomRadA ** 2 * fraction
+        #the estimator for volume assume the volume of 1/2 radius
+        volumes[atoms] = math.pi * ((atomRadA / 2.0) ** 3) * 4.0 / 3.0 * fraction
+    return volumes, surfaces
+
+
 def calcLJ(x, y, dist, hHbonds):
     #see p3 from DRIEDING: A generic force field for molecule simulations
-    R0dic = {
-        'H': 3.195,
-        'C': 3.8983,
-        'N': 3.6621,
-        'O': 3.4046,
-        'S': 4.03
-    }
-    D0Dict = {
-        'H': 0.0152,
-        'C': 0.0951,
-        'N': 0.0774,
-        'O': 0.0957,
-        'S': 0.3440
-    }
-
-    D0X = D0Dict[x.atomType]
-    D0Y = D0Dict[y.atomType]
+    D0X = DREIDING_D0[x.atomType]
+    D0Y = DREIDING_D0[y.atomType]
     if x in hHbonds:
-        D0X = 0.0001
+        D0X = HBOND_H_D0
         #return 0.0
     if y in hHbonds:
-        D0Y = 0.0001
+        D0Y = HBOND_H_D0
         #return 0.0
     D0 = math.sqrt((D0X * D0Y))
-    R0 = math.sqrt((R0dic[x.atomType] * R0dic[y.atomType]))
+    R0 = math.sqrt((DREIDING_R0[x.atomType] * DREIDING_R0[y.atomType]))
     #use the same as AMBER and DRIEDING
     #use aritmethic mean instead of geometric mean can be used instead
     #"more consistent with chemicel practice"
@@ -131,31 +173,10 @@ def calcLJ(x, y, dist, hHbonds):
 
 
 def calcX6(x, y, dist):
-    M0Dict = {
-        'H': 12.382,
-        'C': 14.034,
-        'N': 13.843,
-        'O': 13.483,
-        'S': 12.0
-    }
-    D0Dict = {
-        'H': 0.0152,
-        'C': 0.0951,
-        'N': 0.0774,
-        'O': 0.0957,
-        'S': 0.3440
-    }
-    R0dic = {
-        'H': 3.195,
-        'C': 3.8983,
-        'N': 3.6621,
-        'O': 3.4046,
-        'S': 4.03
-    }
-    D0 = math.sqrt((D0Dict[x.atomType] * D0Dict[y.atomType]))
-    R0 = math.sqrt((R0dic[x.atomType] * R0dic[y.atomType]))
+    D0 = math.sqrt((DREIDING_D0[x.atomType] * DREIDING_D0[y.atomType]))
+    R0 = math.sqrt((DREIDING_R0[x.atomType] * DREIDING_R0[y.atomType]))
     p = (dist / R0)
-    M0 = 13.772
+    M0 = X6_M0
     return D0 * ((6.0 / (M0 - 6)) * math.exp(M0 * (1 - p)) - (M0 / (M0 - 6)) * p ** -6)
 
 
@@ -169,33 +190,65 @@ def calcWDW(atomA, atomBs, lj=True, hHbonds=[]):
     return sumE
 
 
+def ljEnergies(D0X, D0Y, R0X, R0Y, dist):
+    """Batched calcLJ: LJ 12-6 energies of pairs of atoms
+    :param D0X: well depth of the first atoms (see DREIDING_D0)
+    :param D0Y: well depth of the second atoms
+    :param R0X: van der Waals distance of the first atoms (see DREIDING_R0)
+    :param R0Y: van der Waals distance of the second atoms
+    :param dist: distances of the pairs
+    :return: array of energies
+    """
+    D0 = np.sqrt(D0X * D0Y)
+    p = dist / np.sqrt(R0X * R0Y)
+    return D0 * (p ** -12 - 2 * p ** -6)
+
+
+def x6Energies(D0X, D0Y, R0X, R0Y, dist):
+    """Batched calcX6: exponential-6 energies of pairs of atoms (parameters as ljEnergies)"""
+    D0 = np.sqrt(D0X * D0Y)
+    p = dist / np.sqrt(R0X * R0Y)
+    M0 = X6_M0
+    return D0 * ((6.0 / (M0 - 6)) * np.exp(M0 * (1 - p)) - (M0 / (M0 - 6)) * p ** -6)
+
+
 def calcCompl(pdb_path, chains):
     pdb = PDBReader.readFile(pdb_path, chains)
 
     interface = get_interface_atoms(pdb)
     hHbonds = getHbondsH(pdb)
-    components = []
-    for part in pdb.interfaceParts:
-        components.append([a for a in interface if a.chain in part])
-
-    comp2 = [atom for atom in pdb.atoms if atom.chain in pdb.interfaceParts[1]]
-    ktree = KDTree.construct_from_data(comp2)
-    clashV, clashS = 0.0, 0.0
-    sumVDW = 0.0
-    sumVDWx = 0.0
-
-    for atom in components[0]:
-        atomRad = radio_atom(atom.atomType)
-        nearAtoms = list(ktree.findByDistance(query_point=atom.coord, distance=9 ** 2))#(MAX_WW_RAD+atomRad+EPSILON)
-        collusion = [a for a in nearAtoms if math.sqrt(atom.distance(a)) < radio_atom(a.atomType) + atomRad]
-        contact = [a for a in nearAtoms if a not in collusion]
-        surfaceRep = calcClash(atom, collusion, True)
-        volumeRep = calcClash(atom, collusion, False)
-        vdw = calcWDW(atom, contact, hHbonds=hHbonds)
-        vdwx6 = calcWDW(atom, contact, lj=False)
-        sumVDW += vdw
-        sumVDWx += vdwx6
-        clashS += surfaceRep
-        clashV += volumeRep
+    arrays = pdb.getArrays()
+    coords = arrays.coords
+    first = np.array([a.atomIndex for a in interface if a.chain in pdb.interfaceParts[0]], dtype=int)
+
+    # pairs of interface atoms of the first component and atoms of the second component, in one batched query
+    ktree = pdb.getTree(chains=pdb.interfaceParts[1])
+    offsets, neighbors = ktree.findByDistanceBatch(coords[first], VDW_CUTOFF ** 2)  # (MAX_WW_RAD+atomRad+EPSILON)
+    position = np.repeat(np.arange(len(first)), np.diff(offsets))
+    pairA = first[position]
+    pairB = np.array([a.atomIndex for a in ktree.atoms], dtype=int)[neighbors]
+    diff = coords[pairA] - coords[pairB]
+    dist = np.sqrt(diff[:, 0] ** 2 + diff[:, 1] ** 2 + diff[:, 2] ** 2)
+
+    # element indexed parameters of the atoms of the pairs (DREIDING parameters only for atoms in contact pairs)
+    used = np.union1d(pairA, pairB)
+    radius, D0, R0 = np.zeros(len(arrays)), np.zeros(len(arrays)), np.zeros(len(arrays))
+    radius[used] = arrays.element_values(radio_atom, used)
+    collusion = dist < radius[pairB] + radius[pairA]
+    contact = ~collusion
+    used = np.union1d(pairA[contact], pairB[contact])
+    D0[used] = arrays.element_values(DREIDING_D0.__getitem__, used)
+    R0[used] = arrays.element_values(DREIDING_R0.__getitem__, used)
+    D0Hbond = D0.copy()
+    D0Hbond[[a.atomIndex for a in hHbonds]] = HBOND_H_D0
+
+    sumVDW = float(np.sum(ljEnergies(D0Hbond[pairA[contact]], D0Hbond[pairB[contact]], R0[pairA[contact]],
+                                     R0[pairB[contact]], dist[contact])))
+    sumVDWx = float(np.sum(x6Energies(D0[pairA[contact]], D0[pairB[contact]], R0[pairA[contact]],
+                                      R0[pairB[contact]], dist[contact])))
+
+    volumeRep, surfaceRep = calcClashes(coords[first], radius[first], position[collusion],
+                                        coords[pairB[collusion]], radius[pairB[collusion]], dist[collusion])
+    clashV, clashS = float(np.sum(volumeRep)), float(np.sum(surfaceRep))
 
     return sumVDW, sumVDWx, clashV, clashS
@@ -25,10 +25,7 @@ def get_interface_atoms(pdb, includingDistance=False):
                              interfaceAtoms
                              where PDB='%s'""" % pdb.name)
     # find unbounds relating to
-    interfaceAtoms = []
-    for chain, resId, symbol in cursor.fetchall():
-        interfaceAtoms += [a for a in pdb.atoms if a.chain == chain and a.resId == resId and a.symbol[0:3] == symbol]
-    return interfaceAtoms
+    return [pdb.atoms[i] for i in pdb.resolveAtoms(cursor.fetchall(), prefix=True)]
 
 
 def assign_depth(interface):
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+from math import pi
+
+from pyPPI import pdbReader
+from pyPPI.ASA import ASA, ENGINE_SPIRAL, ENGINE_NUMPY, ENGINE_BITMASK, R_WATER, radio_atom, \
+    ADAPTIVE_RESOLUTIONS, ADAPTIVE_TOLERANCE
+from pyPPI.pdbReader import PDBReader
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+INTERFACE_PDB = os.path.join(DATA_DIR, '2XHE_interface.pdb')
+FINE_POINTS = 492
+# approximations: maximal error of atom (fraction of the ball area) and of the total ASA (fraction of the total)
+ATOM_ERROR = 0.04
+TOTAL_ERROR = 0.01
+
+
+class EnginesTest(unittest.TestCase):
+    """Batched ASA engines compared with the per atom spiral engine on interface of 2XHE"""
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.pdbsDir, pdbReader.PDBS_DIR = pdbReader.PDBS_DIR, self.tempDir  # debug files of ASA
+        self.pdb = PDBReader.readFile(INTERFACE_PDB, ['A', 'B'])
+        self.expected = self.areas(engine=ENGINE_SPIRAL)
+
+    def tearDown(self):
+        pdbReader.PDBS_DIR = self.pdbsDir
+        shutil.rmtree(self.tempDir)
+
+    def areas(self, **kwargs):
+        """inter and diff (intra - inter) ASA of the atoms of the interface chains"""
+        asa = ASA(self.pdb, **kwargs)
+        for chain in ''.join(self.pdb.interfaceParts):
+            asa.mesh(chain)
+        asa.perAtom.close()
+        return asa.interPerAtom, asa.diffASAperAtom
+
+    def assertSameAreas(self, expected, areas):
+        for expectedAreas, atomsAreas in zip(expected, areas):
+            self.assertEqual(set(expectedAreas), set(atomsAreas))
+            for atom, area in expectedAreas.items():
+                self.assertAlmostEqual(area, atomsAreas[atom], places=9, msg=atom)
+
+    def assertCloseAreas(self, expected, areas):
+        for expectedAreas, atomsAreas in zip(expected, areas):
+            self.assertEqual(set(expectedAreas), set(atomsAreas))
+            for atom, area in expectedAreas.items():
+                ballArea = 4 * pi * (radio_atom(atom.atomType) + R_WATER) ** 2
+                self.assertLessEqual(abs(area - atomsAreas[atom]), ATOM_ERROR * ballArea, msg=atom)
+            total = sum(expectedAreas.values())
+            self.assertLessEqual(abs(total - sum(atomsAreas.values())), TOTAL_ERROR * total)
+
+    def test_numpy(self):
+        self.assertSameAreas(self.expected, self.areas(engine=ENGINE_NUMPY))
+
+    def test_singlePass(self):
+        # intra and inter ASA from separate occlusion tests
+        self.assertSameAreas(self.expected, self.areas(engine=ENGINE_NUMPY, single_pass=False))
+        self.assertSameAreas(self.areas(engine=ENGINE_NUMPY), self.areas(engine=ENGINE_NUMPY, single_pass=False))
+
+    def test_bitmask(self):
+        # quantized directions and caps of the lookup table
+        self.assertCloseAreas(self.areas(engine=ENGINE_NUMPY, n_points=FINE_POINTS),
+                              self.areas(engine=ENGINE_BITMASK, n_points=FINE_POINTS))
+
+    def test_adaptive(self):
+        # refined atoms are sampled up to the finest resolution
+        expected = self.areas(engine=ENGINE_NUMPY, n_points=max(ADAPTIVE_RESOLUTIONS))
+        for engine in [ENGINE_NUMPY, ENGINE_BITMASK]:
+            self.assertCloseAreas(expected, self.areas(engine=engine, tolerance=ADAPTIVE_TOLERANCE))
+        with self.assertRaises(ValueError):
+            ASA(self.pdb, engine=ENGINE_SPIRAL, tolerance=ADAPTIVE_TOLERANCE)
+
+    def test_unbound(self):
+        expected = ASA.calc_unbound_protein(self.pdb, engine=ENGINE_SPIRAL)
+        self.assertSameAreas([expected], [ASA.calc_unbound_protein(self.pdb, engine=ENGINE_NUMPY)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import unittest
+from math import sqrt
+
+import numpy as np
+
+from pyPPI.ASA import radio_atom
+from pyPPI.pdbReader import PDBReader
+
+try:
+    from pyPPI.surfaceComplementarity import VDW
+except ImportError:  # database driver (MySQLdb/pymysql) is not installed
+    VDW = None
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+INTERFACE_PDB = os.path.join(DATA_DIR, '2XHE_interface.pdb')
+
+
+def contactPairs(pdb, interface):
+    """Interface atoms of the first component and atoms of the second component in VDW_CUTOFF from them
+    :return: list of atom, atoms in contact with it and atoms colliding with it (distance below sum of radii)
+    """
+    second = [a for a in pdb.atoms if a.chain in pdb.interfaceParts[1]]
+    pairs = []
+    for atom in sorted([a for a in interface if a.chain in pdb.interfaceParts[0]], key=lambda a: a.atomIndex):
+        contact, colliding = [], []
+        for b in second:
+            dist = sqrt(atom.distance(b))
+            if dist < VDW.VDW_CUTOFF:
+                (colliding if dist < radio_atom(atom.atomType) + radio_atom(b.atomType) else contact).append(b)
+        pairs.append((atom, contact, colliding))
+    return pairs
+
+
+@unittest.skipIf(VDW is None, 'VDW requires database driver')
+class VDWTest(unittest.TestCase):
+    """Batched VDW kernels compared with calcWDW/calcClash of single atoms on interface of 2XHE"""
+
+    def setUp(self):
+        self.pdb = PDBReader.readFile(INTERFACE_PDB, ['A', 'B'])
+        interface = self.pdb.getInterface()
+        self.pairs = contactPairs(self.pdb, interface)
+        self.hHbonds = [a for a in interface if a.atomType == 'H'][::5]  # (any) hydrogens of hbonds
+
+    def energies(self, kernel, hHbonds):
+        """energies of the contacts of each atom with batched kernel"""
+        owners, atoms, partners = [], [], []
+        for i, (atom, contact, colliding) in enumerate(self.pairs):
+            owners += [i] * len(contact)
+            atoms += [atom] * len(contact)
+            partners += contact
+        D0 = [[VDW.HBOND_H_D0 if a in hHbonds else VDW.DREIDING_D0[a.atomType] for a in side]
+              for side in [atoms, partners]]
+        R0 = [[VDW.DREIDING_R0[a.atomType] for a in side] for side in [atoms, partners]]
+        dist = np.sqrt([a.distance(b) for a, b in zip(atoms, partners)])
+        energies = kernel(np.array(D0[0]), np.array(D0[1]), np.array(R0[0]), np.array(R0[1]), dist)
+        return np.bincount(owners, weights=energies, minlength=len(self.pairs))
+
+    def test_ljEnergies(self):
+        energies = self.energies(VDW.ljEnergies, self.hHbonds)
+        for (atom, contact, colliding), energy in zip(self.pairs, energies.tolist()):
+            self.assertAlmostEqual(VDW.calcWDW(atom, contact, lj=True, hHbonds=self.hHbonds), energy, places=9)
+
+    def test_x6Energies(self):
+        energies = self.energies(VDW.x6Energies, [])
+        for (atom, contact, colliding), energy in zip(self.pairs, energies.tolist()):
+            self.assertAlmostEqual(VDW.calcWDW(atom, contact, lj=False), energy, places=9)
+
+    def test_calcClashes(self):
+        atoms = [atom for atom, contact, colliding in self.pairs]
+        owners = np.repeat(np.arange(len(atoms)), [len(colliding) for atom, contact, colliding in self.pairs])
+        partners = [b for atom, contact, colliding in self.pairs for b in colliding]
+        dist = np.sqrt([atoms[i].distance(b) for i, b in zip(owners.tolist(), partners)])
+        volumes, surfaces = VDW.calcClashes(np.array([a.coord for a in atoms]),
+                                            np.array([radio_atom(a.atomType) for a in atoms]), owners,
+                                            np.array([b.coord for b in partners]).reshape(-1, 3),
+                                            np.array([radio_atom(b.atomType) for b in partners]), dist)
+        # exact (single colliding atom) and estimated (several colliding atoms) clashes
+        self.assertTrue(any(len(colliding) == 1 for atom, contact, colliding in self.pairs))
+        self.assertTrue(any(len(colliding) > 1 for atom, contact, colliding in self.pairs))
+        for (atom, contact, colliding), volume, surface in zip(self.pairs, volumes.tolist(), surfaces.tolist()):
+            self.assertAlmostEqual(VDW.calcClash(atom, colliding, surface=False), volume, places=9)
+            self.assertAlmostEqual(VDW.calcClash(atom, colliding, surface=True), surface, places=9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import unittest
+from math import sqrt
+
+from pyPPI.pdbReader import PDBReader
+
+try:
+    from pyPPI import electrostat
+except ImportError:  # database driver (MySQLdb/pymysql) is not installed
+    electrostat = None
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+INTERFACE_PDB = os.path.join(DATA_DIR, '2XHE_interface.pdb')
+
+
+def calcElectrostaticPairs(pdb, interface, count_cutoff_distance=5, pH=7):
+    """calcElectrostatic with a loop over pairs of charged atoms
+    :return: energy, number of positive-positive, negative-negative and positive-negative pairs
+    """
+    def charge(atom):
+        return electrostat.assignCharge(atom, pH, pdb)
+
+    second = [a for a in pdb.atoms if a.chain in pdb.interfaceParts[1] and charge(a) != 0]
+    electroStat, pp, mm, pm = 0.0, 0, 0, 0
+    for atom in [a for a in interface if a.chain in pdb.interfaceParts[0] and charge(a) != 0]:
+        Qi = charge(atom)
+        for con in second:
+            R = sqrt(atom.distance(con))
+            if R > electrostat.ELECTROSTATIC_CUTOFF:
+                continue
+            Qj = charge(con)
+            electroStat += electrostat.eInteraction(Qi, Qj, R)
+            if R < count_cutoff_distance:
+                if Qi > 0 and Qj > 0:
+                    pp += 1
+                elif Qi < 0 and Qj < 0:
+                    mm += 1
+                else:
+                    pm += 1
+    return electroStat, pp, mm, pm
+
+
+@unittest.skipIf(electrostat is None, 'electrostat requires database driver')
+class ElectrostaticTest(unittest.TestCase):
+    """Vectorized calcElectrostatic compared with loop over pairs of charged atoms on interface of 2XHE"""
+
+    def setUp(self):
+        self.pdb = PDBReader.readFile(INTERFACE_PDB, ['A', 'B'])
+        self.interface = self.pdb.getInterface()
+
+    def test_calcElectrostatic(self):
+        expected = calcElectrostaticPairs(self.pdb, self.interface)
+        electroStat, pp, mm, pm = electrostat.calcElectrostatic(self.pdb, self.interface)
+        self.assertNotEqual(0, expected[0])
+        self.assertAlmostEqual(expected[0], electroStat, places=9)
+        self.assertEqual(expected[1:], (pp, mm, pm))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import unittest
+from math import sqrt
+
+import numpy as np
+
+from pyPPI.hbonds import hbonds, WATER_LENGTH
+from pyPPI.pdbReader import PDBReader
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+INTERFACE_PDB = os.path.join(DATA_DIR, '2XHE_interface.pdb')
+WATERS_PDB = os.path.join(DATA_DIR, '1LCD_interface.pdb')
+
+
+def buildWaterPairs(hbondsCalc, interface):
+    """buildWater with a loop over pairs of interface atom and water
+    :return: hbonds, closest atoms of pseudo chain A and of pseudo chain B to each water, waters on the interface
+    """
+    waters = hbondsCalc.pdb.waters
+    minDistanceA = dict((water, (None, 7)) for water in waters)
+    minDistanceB = dict((water, (None, 7)) for water in waters)
+    probablInterface, lessThan35, interfaceB = set(), dict(), set()
+    for atom in [a for a in interface if a.atomType != 'H']:
+        for water in waters:
+            sqDist = sqrt(water.distance(atom))
+            if sqDist < WATER_LENGTH:
+                if atom.pseudoChain == 'A':
+                    probablInterface.add(water)
+                    if sqDist < minDistanceA[water][1]:
+                        minDistanceA[water] = atom, sqDist
+                elif atom.pseudoChain == 'B' and water in probablInterface and \
+                        min(minDistanceA[water][1], sqDist) < 3.5:
+                    if sqDist < minDistanceB[water][1]:
+                        minDistanceB[water] = atom, sqDist
+                    interfaceB.add(water)
+                if sqDist < 3.5:
+                    lessThan35.setdefault(water, set()).add(atom)
+    hbondMethod = hbondsCalc.waterHbondHDPlus if hbondsCalc.HDPlusDefinition else hbondsCalc.newWaterHbond
+    waterHbonds = [(atom, water) for water in interfaceB for atom in lessThan35[water]
+                   if any(hbondMethod(atom, water, sqrt(water.distance(atom))))]
+    return waterHbonds, minDistanceA, minDistanceB, interfaceB
+
+
+class BatchedHbondsTest(unittest.TestCase):
+    """Batched hbonds checks compared with the checks of single pairs on interface of 2XHE"""
+
+    def setUp(self):
+        self.pdb = PDBReader.readFile(INTERFACE_PDB, ['A', 'B'])
+        self.hbonds = hbonds(self.pdb)
+        self.donors, self.acceptors = self.hbonds.candidatePairs(self.pdb.getInterface())
+        self.pairs = [(self.pdb.atoms[d], self.pdb.atoms[a]) for d, a in zip(self.donors.tolist(),
+                                                                            self.acceptors.tolist())]
+
+    def test_HBPlus(self):
+        expected = [self.hbonds.checkHbondHBPlus(donor, acceptor)[0] for donor, acceptor in self.pairs]
+        found = self.hbonds.checkHbondsHBPlus(self.donors, self.acceptors)
+        self.assertTrue(any(expected))
+        self.assertEqual(expected, found.tolist())
+
+    def test_Dreiding(self):
+        expected = [self.hbonds.checkHbond(donor, acceptor) for donor, acceptor in self.pairs]
+        found, energies = self.hbonds.checkHbondsDreiding(self.donors, self.acceptors)
+        self.assertTrue(any(haveHbond for haveHbond, _ in expected))
+        self.assertEqual([haveHbond for haveHbond, _ in expected], found.tolist())
+        np.testing.assert_allclose([eHB for _, eHB in expected], energies, rtol=1e-9)
+
+
+class WaterTest(unittest.TestCase):
+    """buildWater compared with loop over pairs of atom and water on interface of 1LCD (protein and DNA)"""
+
+    def setUp(self):
+        self.pdb = PDBReader.readFile(WATERS_PDB, ['A', 'BC'])
+        # atoms of A first: waters are near A before they are checked with atoms of B
+        self.interface = sorted(self.pdb.getInterface(), key=lambda a: (a.pseudoChain != 'A', a.atomIndex))
+
+    def assertSameClosest(self, expected, minDistance):
+        self.assertEqual(set(expected), set(minDistance))
+        for water, (atom, dist) in expected.items():
+            self.assertIs(atom, minDistance[water][0])
+            self.assertAlmostEqual(dist, minDistance[water][1], places=9)
+
+    def test_buildWater(self):
+        for definition in [True, False]:
+            hbondsCalc = hbonds(self.pdb)
+            hbondsCalc.HDPlusDefinition = definition
+            expected = buildWaterPairs(hbondsCalc, self.interface)
+            waterHbonds, minDistanceA, minDistanceB, interfaceB = hbondsCalc.buildWater(self.interface)
+            self.assertTrue(expected[0])
+            self.assertEqual(set(expected[0]), set(waterHbonds))
+            self.assertEqual(len(expected[0]), len(waterHbonds))
+            self.assertSameClosest(expected[1], minDistanceA)
+            self.assertSameClosest(expected[2], minDistanceB)
+            self.assertEqual(expected[3], interfaceB)
+
+
+if __name__ == '__main__':
+    unittest.main()
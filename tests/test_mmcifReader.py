@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyPPI.pdbReader import PDBReader
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+MULTI_CHAIN_CIF = os.path.join(DATA_DIR, 'multiChain.cif')
+
+
+class MultiCharacterChainTest(unittest.TestCase):
+    """Chains are single characters, so longer mmCIF chain ids (auth_asym_id) are rejected"""
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_rejected(self):
+        with self.assertRaises(ValueError) as context:
+            PDBReader.readFile(MULTI_CHAIN_CIF, ['A', 'BA'])
+        self.assertIn('BA, BB', str(context.exception))
+
+    def test_singleCharacter(self):
+        # the same structure with the chains renamed to single characters
+        path = os.path.join(self.tempDir, 'singleChain.cif')
+        with open(MULTI_CHAIN_CIF) as multiFile, open(path, 'w') as singleFile:
+            singleFile.write(multiFile.read().replace(' BA', ' B').replace('BB', 'C'))
+        pdb = PDBReader.readFile(path)  # interface parts are the chains of the compounds
+        self.assertEqual(12, len(pdb.atoms))
+        self.assertEqual(['A', 'B', 'C'], sorted(set(a.chain for a in pdb.atoms)))
+        self.assertEqual(['A', 'BC'], pdb.interfaceParts)
+
+
+if __name__ == '__main__':
+    unittest.main()
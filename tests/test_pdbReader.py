@@ -0,0 +1,55 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyPPI.pdbReader import PDBReader
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+BLANK_CHAIN_PDB = os.path.join(DATA_DIR, 'blankChain.pdb')
+
+
+def atomsSummary(pdb):
+    """Attributes of the atoms, waters and HETATMs of a PDB object"""
+    return [[(a.atomNum, a.symbol, a.residue, a.chain, a.resId, a.atomType, a.pseudoChain if atoms is pdb.atoms else None,
+              a.coord) for a in atoms] for atoms in [pdb.atoms, pdb.waters, pdb.hetatms]]
+
+
+class BlankChainTest(unittest.TestCase):
+    """Atoms with blank chain column are read the same way by all the readers"""
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.expected = PDBReader.readFile(BLANK_CHAIN_PDB, ['A', 'B'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_readFile(self):
+        blank = [a for a in self.expected.atoms if a.chain == ' ']
+        self.assertEqual(8, len(blank))
+        self.assertTrue(all(a.pseudoChain is None for a in blank))
+        self.assertTrue(all(a.pseudoChain == 'A' for a in self.expected.atoms if a.chain == 'A'))
+
+    def test_readFileFast(self):
+        pdb = PDBReader.readFileFast(BLANK_CHAIN_PDB, ['A', 'B'])
+        self.assertEqual(atomsSummary(self.expected), atomsSummary(pdb))
+
+    def test_readFileGz(self):
+        path = os.path.join(self.tempDir, 'blankChain.pdb.gz')
+        with open(BLANK_CHAIN_PDB, 'rb') as pdbFile, gzip.open(path, 'wb') as gzFile:
+            gzFile.write(pdbFile.read())
+        pdb = PDBReader.readFile(path, ['A', 'B'])
+        self.assertEqual(atomsSummary(self.expected), atomsSummary(pdb))
+
+    def test_readFileCached(self):
+        cacheDir = os.path.join(self.tempDir, 'cache')
+        for _ in range(2):  # parsed and then loaded from the cache
+            pdb = PDBReader.readFileCached(BLANK_CHAIN_PDB, ['A', 'B'], cache_dir=cacheDir)
+            self.assertEqual(atomsSummary(self.expected), atomsSummary(pdb))
+        self.assertTrue(os.listdir(cacheDir))
+
+
+if __name__ == '__main__':
+    unittest.main()